@@ -2,7 +2,11 @@ from flask import Flask
 from flask_cors import CORS
 import os
 
-from app.models.database import create_tables
+from sqlalchemy.engine import Engine
+
+from app.models.database import close_request_db
+from app.utils.label_cache import instrument_label_writes
+from app.utils.stage_timing import instrument_engine, record_request_timing, start_timing
 
 def create_app():
     # Create Flask app
@@ -11,8 +15,17 @@ def create_app():
     # Configure CORS
     CORS(app)
     
-    # Create database tables
-    create_tables()
+    # Close each request's database session when its app context ends
+    app.teardown_appcontext(close_request_db)
+    
+    # Time sampled requests stage by stage (Server-Timing header and /metrics).
+    # The engine doesn't exist until the first query, so listen on the class.
+    instrument_engine(Engine)
+    app.before_request(start_timing)
+    app.after_request(record_request_timing)
+    
+    # Drop cached labels when a session commits changes to them
+    instrument_label_writes()
     
     # Import and register API routes
     from app.routes import api_bp
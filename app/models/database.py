@@ -1,19 +1,100 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, Float, Text
+import threading
+import time
+from flask import g
+from sqlalchemy import create_engine, Column, Integer, String, Float, Text, LargeBinary
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 
-# Get database URL from environment variables
-database_url = os.environ.get('DATABASE_URL')
-if database_url and database_url.startswith('postgres://'):
-    database_url = database_url.replace('postgres://', 'postgresql://', 1)
+from .label_data import LABEL_FIELDS, NUMERIC_COLUMNS, LabelData, parse_amount
 
-# Create engine
-engine = create_engine(database_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Connection pool sizing for each process. Every gunicorn worker holds up to
+# DB_POOL_SIZE + DB_MAX_OVERFLOW connections, so size these against the
+# server's max_connections.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1').lower() not in ('0', 'false', 'no')
+
+# Checkout counters for the connection pool, reported by pool_stats()
+_pool_counters = {"checkouts": 0, "timeouts": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0}
+_pool_counters_lock = threading.Lock()
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection"""
+
+    def connect(self):
+        start = time.perf_counter()
+        timed_out = False
+        try:
+            return super().connect()
+        except PoolTimeoutError:
+            timed_out = True
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with _pool_counters_lock:
+                _pool_counters["checkouts"] += 1
+                _pool_counters["timeouts"] += timed_out
+                _pool_counters["wait_seconds"] += waited
+                _pool_counters["max_wait_seconds"] = max(_pool_counters["max_wait_seconds"], waited)
+
+def _engine_options(url):
+    options = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    # In-memory SQLite keeps its single shared connection pool
+    if url and url.startswith("sqlite") and (":memory:" in url or url.rstrip("/") == "sqlite:"):
+        return options
+    options.update(
+        poolclass=MeteredQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT
+    )
+    return options
+
+def database_url():
+    """Return the database URL from the environment; raises RuntimeError when it isn't set"""
+    url = os.environ.get('DATABASE_URL')
+    if not url:
+        raise RuntimeError("DATABASE_URL is not set")
+    if url.startswith('postgres://'):
+        url = url.replace('postgres://', 'postgresql://', 1)
+    return url
+
+# The engine is created on first use rather than at import, so importing the
+# app needs no database configuration and each forked worker builds its own pool
+_engine = None
+_engine_lock = threading.Lock()
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
+
+def get_engine():
+    """Return this process's engine, creating it on first use"""
+    global _engine
+    engine = _engine
+    if engine is None:
+        with _engine_lock:
+            if _engine is None:
+                url = database_url()
+                _engine = create_engine(url, **_engine_options(url))
+            engine = _engine
+    return engine
+
+def SessionLocal():
+    """Open a new session on the engine"""
+    return _session_factory(bind=get_engine())
 
 Base = declarative_base()
 
+def numeric_values(label_dict):
+    """Return the numeric column values for a dictionary of label fields"""
+    return {
+        column: parse_amount(label_dict.get(field))[0]
+        for field, column in NUMERIC_COLUMNS.items()
+    }
+
 class NutritionLabel(Base):
     __tablename__ = "nutrition_labels"
 
@@ -38,11 +119,114 @@ class NutritionLabel(Base):
     potassium = Column(String)
     label_format = Column(String, default="standard")
 
+    # Numeric amounts kept in step with the string fields above by
+    # set_label_data. The nutrients filtered on most often are indexed.
+    serving_size_g = Column(Float)
+    servings_per_container_count = Column(Float)
+    calories_kcal = Column(Float, index=True)
+    total_fat_g = Column(Float, index=True)
+    saturated_fat_g = Column(Float)
+    trans_fat_g = Column(Float)
+    cholesterol_mg = Column(Float)
+    sodium_mg = Column(Float, index=True)
+    total_carbs_g = Column(Float)
+    dietary_fiber_g = Column(Float)
+    total_sugars_g = Column(Float, index=True)
+    added_sugars_g = Column(Float)
+    protein_g = Column(Float, index=True)
+    vitamin_d_mcg = Column(Float)
+    calcium_mg = Column(Float)
+    iron_mg = Column(Float)
+    potassium_mg = Column(Float)
+
+    @classmethod
+    def from_label_data(cls, label, label_format="standard"):
+        """Build a row from a LabelData"""
+        row = cls(label_format=label_format)
+        row.set_label_data(label)
+        return row
+
+    def set_label_data(self, label):
+        """Write a LabelData's fields and the numbers it already parsed from them"""
+        for field, value in zip(LABEL_FIELDS, label.values):
+            setattr(self, field, value)
+        for column, number in label.numeric_columns().items():
+            setattr(self, column, number)
+
+    def to_label_data(self):
+        """Return the label fields as the LabelData the renderers expect"""
+        return LabelData.from_row(self)
+
+class RenderJob(Base):
+    """A queued render or batch render, claimed and run by any app process when JOB_BACKEND=database"""
+    __tablename__ = "render_jobs"
+
+    id = Column(String(32), primary_key=True)
+    kind = Column(String)
+    status = Column(String)
+    total = Column(Integer, default=0)
+    done = Column(Integer, default=0)
+    error = Column(Text)
+    filename = Column(String)
+    mimetype = Column(String)
+    # JSON parameters the job is run from
+    params = Column(Text)
+    result = Column(LargeBinary)
+    created_at = Column(Float, index=True)
+    updated_at = Column(Float)
+
+class LabelRendition(Base):
+    """Pre-rendered bytes of a saved label, keyed by label id and content hash"""
+    __tablename__ = "label_renditions"
+
+    label_id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), primary_key=True)
+    output_format = Column(String)
+    data = Column(LargeBinary)
+    created_at = Column(Float)
+
 # Create the tables in the database
 def create_tables():
+    """Create missing tables and columns; run by the migration step, not at app startup"""
+    engine = get_engine()
     Base.metadata.create_all(bind=engine)
+    
+    # Databases created before the numeric columns (or the job parameters)
+    # existed need them added
+    from .migrations import add_job_columns, add_numeric_columns
+    return add_numeric_columns(engine) + add_job_columns(engine)
+
+def pool_stats():
+    """Return connection pool occupancy and checkout wait counters"""
+    with _pool_counters_lock:
+        stats = dict(_pool_counters)
+    stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["checkouts"] if stats["checkouts"] else 0.0
+    
+    # Nothing to report until the first query creates the engine
+    pool = _engine.pool if _engine is not None else None
+    if isinstance(pool, QueuePool):
+        stats.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            idle=pool.checkedin(),
+            overflow=pool.overflow(),
+            max_overflow=DB_MAX_OVERFLOW
+        )
+    return stats
+
+def get_request_db():
+    """Return the session for the current request, opening it on first use"""
+    if "db" not in g:
+        g.db = SessionLocal()
+    return g.db
+
+def close_request_db(exception=None):
+    """Close the current request's session, returning its connection to the pool"""
+    db = g.pop("db", None)
+    if db is not None:
+        db.close()
 
-# Get a database session
+# Get a database session (for scripts; requests use get_request_db)
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,139 @@
+import hashlib
+import json
+from operator import attrgetter
+from types import MappingProxyType
+
+from ..utils.amounts import parse_amount
+from ..utils.daily_values import DAILY_VALUES, dv_from_amount
+from ..utils.stage_timing import stage
+
+# Label fields passed to the renderers, in display order
+LABEL_FIELDS = (
+    "product_name",
+    "serving_size",
+    "servings_per_container",
+    "calories",
+    "total_fat",
+    "saturated_fat",
+    "trans_fat",
+    "cholesterol",
+    "sodium",
+    "total_carbs",
+    "dietary_fiber",
+    "total_sugars",
+    "added_sugars",
+    "protein",
+    "vitamin_d",
+    "calcium",
+    "iron",
+    "potassium"
+)
+
+# Numeric copy of each amount field, named with its unit, so range filters
+# ("sodium over 600 mg") and sorting run inside the database
+NUMERIC_COLUMNS = {
+    "serving_size": "serving_size_g",
+    "servings_per_container": "servings_per_container_count",
+    "calories": "calories_kcal",
+    "total_fat": "total_fat_g",
+    "saturated_fat": "saturated_fat_g",
+    "trans_fat": "trans_fat_g",
+    "cholesterol": "cholesterol_mg",
+    "sodium": "sodium_mg",
+    "total_carbs": "total_carbs_g",
+    "dietary_fiber": "dietary_fiber_g",
+    "total_sugars": "total_sugars_g",
+    "added_sugars": "added_sugars_g",
+    "protein": "protein_g",
+    "vitamin_d": "vitamin_d_mcg",
+    "calcium": "calcium_mg",
+    "iron": "iron_mg",
+    "potassium": "potassium_mg"
+}
+
+_FIELD_SET = frozenset(LABEL_FIELDS)
+_row_values = attrgetter(*LABEL_FIELDS)
+
+class LabelData:
+    """One label's field values as every route and renderer takes them.
+
+    Immutable, so everything derived from the values is worked out once when
+    it's built: the content hash render cache keys and ETags start from, the
+    parsed amount of each numeric field, the %DV of each nutrient and the
+    values layout templates are filled from.
+    """
+
+    __slots__ = ("values", "content_hash", "amounts", "invalid_amounts", "daily_values", "template_values")
+
+    def __init__(self, values):
+        values = tuple(values)
+        if len(values) != len(LABEL_FIELDS):
+            raise ValueError(f"expected {len(LABEL_FIELDS)} label values, got {len(values)}")
+
+        # Normalized so 5 and "5" (which render identically) hash the same
+        normalized = [None if value is None else str(value) for value in values]
+        content_hash = hashlib.sha256(json.dumps(normalized, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+        fields = dict(zip(LABEL_FIELDS, values))
+        # Blank and unparseable amounts are None; the fields that didn't parse are listed
+        amounts = {}
+        invalid_amounts = []
+        for field in NUMERIC_COLUMNS:
+            amounts[field], ok = parse_amount(fields[field])
+            if not ok:
+                invalid_amounts.append(field)
+        with stage("dv"):
+            daily_values = {nutrient: dv_from_amount(amounts[nutrient], reference) for nutrient, reference in DAILY_VALUES.items()}
+        for nutrient, percent in daily_values.items():
+            fields[f"{nutrient}_dv"] = percent
+
+        set_slot = object.__setattr__
+        set_slot(self, "values", values)
+        set_slot(self, "content_hash", content_hash)
+        set_slot(self, "amounts", MappingProxyType(amounts))
+        set_slot(self, "invalid_amounts", tuple(invalid_amounts))
+        set_slot(self, "daily_values", MappingProxyType(daily_values))
+        # Every field plus a <nutrient>_dv for each daily value
+        set_slot(self, "template_values", MappingProxyType(fields))
+
+    @classmethod
+    def from_row(cls, label):
+        """Build from a NutritionLabel row"""
+        return cls(_row_values(label))
+
+    @classmethod
+    def from_payload(cls, data):
+        """Build from a JSON request payload; missing fields are empty"""
+        return cls(data.get(field, '') for field in LABEL_FIELDS)
+
+    def replace(self, changes):
+        """Return a copy with some fields changed"""
+        return LabelData(changes.get(field, value) for field, value in zip(LABEL_FIELDS, self.values))
+
+    def get(self, field, default=None):
+        """Return a field's value, like dict.get"""
+        return self.template_values.get(field, default) if field in _FIELD_SET else default
+
+    def to_dict(self):
+        """Return the fields as a new dictionary"""
+        return dict(zip(LABEL_FIELDS, self.values))
+
+    def numeric_columns(self):
+        """Return the parsed amounts keyed by their NUMERIC_COLUMNS column names"""
+        return {column: self.amounts[field] for field, column in NUMERIC_COLUMNS.items()}
+
+    def __setattr__(self, name, value):
+        raise AttributeError("LabelData is immutable")
+
+    def __reduce__(self):
+        # Sent to the render pool as just its values; the rest is rebuilt there
+        return (LabelData, (self.values,))
+
+    def __eq__(self, other):
+        return isinstance(other, LabelData) and self.content_hash == other.content_hash
+
+    def __hash__(self):
+        return hash(self.content_hash)
+
+    def __repr__(self):
+        return f"LabelData({self.to_dict()!r})"
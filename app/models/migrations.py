@@ -0,0 +1,121 @@
+"""Schema setup: creates missing tables, adds the numeric nutrient columns and backfills them from the string fields.
+
+Run before starting the app on a new or older database; startup does no schema work.
+
+Usage: python -m app.models.migrations [--batch-size 500] [--report unparseable.json]
+"""
+import argparse
+import json
+import os
+
+from sqlalchemy import bindparam, inspect, select, text, update
+
+from .database import NUMERIC_COLUMNS, NutritionLabel, RenderJob, create_tables, get_engine, parse_amount
+
+# Rows read and updated per backfill transaction
+BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', 500))
+
+def add_numeric_columns(bind=None):
+    """Add any missing numeric columns and their indexes; returns the names of the columns added"""
+    bind = bind if bind is not None else get_engine()
+    table = NutritionLabel.__table__
+    numeric = set(NUMERIC_COLUMNS.values())
+    
+    # New columns are nullable with no default, so adding them doesn't rewrite the table
+    existing = {column["name"] for column in inspect(bind).get_columns(table.name)}
+    added = [column for column in NUMERIC_COLUMNS.values() if column not in existing]
+    if added:
+        with bind.begin() as conn:
+            for column in added:
+                column_type = table.c[column].type.compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column} {column_type}"))
+    
+    existing_indexes = {index["name"] for index in inspect(bind).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name in existing_indexes or not numeric.intersection(index.columns.keys()):
+            continue
+        if bind.dialect.name == "postgresql":
+            # Build the index without locking out writes; CONCURRENTLY can't run inside a transaction
+            columns = ", ".join(index.columns.keys())
+            with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table.name} ({columns})"))
+        else:
+            index.create(bind=bind, checkfirst=True)
+    
+    return added
+
+def add_job_columns(bind=None):
+    """Add the render_jobs columns that came after the table did; returns their names"""
+    bind = bind if bind is not None else get_engine()
+    table = RenderJob.__table__
+    
+    # Jobs queued before the database backend ran them from the table had no parameters
+    existing = {column["name"] for column in inspect(bind).get_columns(table.name)}
+    added = [column for column in ("params",) if column not in existing]
+    if added:
+        with bind.begin() as conn:
+            for column in added:
+                column_type = table.c[column].type.compile(dialect=bind.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column} {column_type}"))
+    return added
+
+def backfill_numeric_columns(bind=None, batch_size=BACKFILL_BATCH_SIZE):
+    """Fill the numeric columns from the string fields in id-ordered batches and report what didn't parse"""
+    bind = bind if bind is not None else get_engine()
+    table = NutritionLabel.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("row_id"))
+        .values({column: bindparam(f"new_{column}") for column in NUMERIC_COLUMNS.values()})
+    )
+    
+    report = {"rows": 0, "unparseable": []}
+    last_id = 0
+    while True:
+        # One short transaction per batch so the app keeps serving while the table fills in
+        with bind.begin() as conn:
+            rows = conn.execute(
+                select(table.c.id, *[table.c[field] for field in NUMERIC_COLUMNS])
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                return report
+            
+            params = []
+            for row in rows:
+                values = {"row_id": row.id}
+                for field, column in NUMERIC_COLUMNS.items():
+                    raw = row._mapping[field]
+                    number, ok = parse_amount(raw)
+                    if not ok:
+                        report["unparseable"].append({"id": row.id, "field": field, "value": raw})
+                    values[f"new_{column}"] = number
+                params.append(values)
+            conn.execute(statement, params)
+        
+        report["rows"] += len(rows)
+        last_id = rows[-1].id
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=BACKFILL_BATCH_SIZE, help="rows updated per transaction")
+    parser.add_argument("--report", help="write the unparseable values to this JSON file")
+    args = parser.parse_args()
+    
+    # Creates the schema on a new database; the app itself never runs DDL
+    added = create_tables()
+    print(f"Added columns: {', '.join(added) if added else 'none'}")
+    
+    report = backfill_numeric_columns(batch_size=args.batch_size)
+    print(f"Backfilled {report['rows']} rows, {len(report['unparseable'])} values could not be parsed")
+    for entry in report["unparseable"]:
+        print(f"  label {entry['id']}: {entry['field']} = {entry['value']!r}")
+    
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
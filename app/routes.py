@@ -1,15 +1,224 @@
-from flask import Blueprint, jsonify, request, send_file, render_template
+from flask import Blueprint, current_app, jsonify, request, send_file, render_template, make_response, Response, stream_with_context
 from sqlalchemy.orm import Session
 from io import BytesIO
+import gzip
 import json
+import operator
+import os
+import select
+import socket
 
-from app.models.database import NutritionLabel, get_db
-from app.utils.pdf_generator import create_nutrition_label_pdf
-from app.utils.simple_image_generator import create_nutrition_label_image
+from app.models.database import LABEL_FIELDS, NUMERIC_COLUMNS, NutritionLabel, SessionLocal, get_request_db, parse_amount, pool_stats
+from app.models.label_data import LabelData
+from app.utils.batch_renderer import BATCH_RENDER_MAX_ITEMS, BatchItem, batch_archive_entries, iter_label_items
+from app.utils.bulk_import import bulk_insert_labels, iter_bulk_rows
+from app.utils.font_registry import font_cache_stats
+from app.utils.job_queue import JOB_RETRY_AFTER, JobQueueFull, get_job_queue, submit_batch_job, submit_render_job
+from app.utils.label_cache import get_label_cache
+from app.utils.label_renderer import DEFAULT_RENDER_OPTIONS, MIMETYPES, normalize_output_format, render_key, render_label, render_options, render_tier_stats
+from app.utils.preview_sessions import preview_sessions
+from app.utils.render_cache import RenderCancelled, render_cache
+from app.utils.rendition_store import RENDITION_DIR, prerender_label, rendition_path, store_rendition, stored_rendition
+from app.utils.stage_timing import render_metrics, tag_render
+from app.utils.warmup import ensure_warm_up, warm_up_stats
+from app.utils.zip_stream import stream_zip
 
 # Create blueprint
 api_bp = Blueprint('api', __name__)
 
+# How long browsers and the CDN may reuse a downloaded label before revalidating (seconds)
+LABEL_CACHE_MAX_AGE = int(os.environ.get('LABEL_CACHE_MAX_AGE', 300))
+
+# How downloads of renditions on disk are sent: "sendfile" streams the file
+# from the worker, "x-accel-redirect" and "x-sendfile" leave it to nginx or
+# Apache. RENDITION_ACCEL_PREFIX is the internal nginx location aliased to
+# RENDITION_DIR.
+RENDITION_SERVE_MODE = os.environ.get('RENDITION_SERVE_MODE', 'sendfile').lower()
+RENDITION_ACCEL_PREFIX = os.environ.get('RENDITION_ACCEL_PREFIX', '/_renditions/')
+
+# Text output formats sent gzipped to clients that accept it
+COMPRESSIBLE_FORMATS = ("svg",)
+
+# Labels returned by GET /api/labels when no limit is given, and the most allowed
+LABEL_LIST_DEFAULT_LIMIT = int(os.environ.get('LABEL_LIST_DEFAULT_LIMIT', 50))
+LABEL_LIST_MAX_LIMIT = int(os.environ.get('LABEL_LIST_MAX_LIMIT', 500))
+
+def close_when_done(chunks, db):
+    """Yield from a streamed body and close its database session once it ends or is aborted"""
+    try:
+        yield from chunks
+    finally:
+        db.close()
+
+def send_rendition_file(path, download_name, mimetype, etag):
+    """Send a stored rendition by path, or hand it to the front server to send"""
+    if RENDITION_SERVE_MODE in ("x-accel-redirect", "x-sendfile"):
+        # nginx (X-Accel-Redirect) or Apache/lighttpd (X-Sendfile) reads the
+        # file and answers Range requests itself; we only send headers
+        response = make_response("")
+        if RENDITION_SERVE_MODE == "x-accel-redirect":
+            relative = os.path.relpath(path, RENDITION_DIR).replace(os.sep, "/")
+            response.headers["X-Accel-Redirect"] = f"{RENDITION_ACCEL_PREFIX.rstrip('/')}/{relative}"
+        else:
+            response.headers["X-Sendfile"] = os.path.abspath(path)
+        response.mimetype = mimetype
+        response.headers["Content-Disposition"] = f"attachment; filename={download_name}"
+        response.set_etag(etag)
+        return response
+    
+    # send_file on a path uses the server's sendfile support and answers
+    # Range requests with 206 partial content
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=mimetype,
+        etag=etag,
+        conditional=True
+    )
+
+def request_render_options(data=None):
+    """Read the quality, width, scale and dpi parameters from a JSON body or the query string"""
+    def param(name):
+        if data is not None and data.get(name) is not None:
+            return data.get(name)
+        return request.args.get(name)
+    
+    return render_options(param('quality'), param('width'), param('scale'), param('dpi'))
+
+def client_disconnect_check():
+    """Return a callable that reports whether the client of this request has hung up"""
+    # The dev server and gunicorn both hand the connection to the app; other
+    # servers don't, and their renders simply run to completion
+    sock = request.environ.get("werkzeug.socket") or request.environ.get("gunicorn.socket")
+    if sock is None:
+        return None
+    
+    def disconnected():
+        try:
+            readable, _, _ = select.select([sock], [], [], 0)
+            # The body has been read, so a readable socket with nothing left
+            # on it means the client closed the connection
+            return bool(readable) and sock.recv(1, socket.MSG_PEEK) == b""
+        except ValueError:
+            # TLS sockets can't be peeked at
+            return False
+        except OSError:
+            return True
+    
+    return disconnected
+
+def compress_for_client(data, output_format):
+    """Gzip text output for clients that accept it; returns (body, content encoding or None)"""
+    # A listed encoding can still be refused, as in "gzip;q=0"
+    if output_format in COMPRESSIBLE_FORMATS and request.accept_encodings["gzip"] > 0:
+        return gzip.compress(data, 6), "gzip"
+    return data, None
+
+def send_label_download(label_id, label, format_type, output_format, options=None):
+    """Send a rendered label with an ETag, answering If-None-Match with 304 before rendering"""
+    etag = render_key(label, format_type, output_format, options)
+    cache_control = f"public, max-age={LABEL_CACHE_MAX_AGE}, must-revalidate"
+    tag_render(format_type, output_format)
+    
+    # The ETag only depends on the stored content, so a matching client copy
+    # can be confirmed without rendering anything. Gzipped copies carry their
+    # own ETag, since they are different bytes.
+    matched = next((tag for tag in (etag, f"{etag}-gzip") if request.if_none_match.contains(tag)), None)
+    if matched is not None:
+        response = make_response("", 304)
+        response.set_etag(matched)
+        if output_format in COMPRESSIBLE_FORMATS:
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = cache_control
+        return response
+    
+    download_name = f"nutrition-label-{label_id}.{output_format}"
+    
+    # Serve the pre-rendered copy when there is one, otherwise render it
+    # (or reuse a cached render of the same content) and keep it for next time.
+    # Only standard renders are stored; other sizes come from the render cache.
+    # Text formats may be gzipped per client, so they're never sent as files.
+    stored = options is None or options == DEFAULT_RENDER_OPTIONS
+    as_file = stored and output_format not in COMPRESSIBLE_FORMATS
+    path = rendition_path(label_id, etag, output_format) if as_file else None
+    if path is None:
+        data = stored_rendition(label_id, etag, output_format) if stored else None
+        if data is None:
+            data = render_label(label, format_type, output_format, options)
+            if stored:
+                store_rendition(label_id, etag, output_format, data)
+                path = rendition_path(label_id, etag, output_format) if as_file else None
+    
+    # Renditions on disk are sent as files, so the bytes never pass through Python
+    if path is not None:
+        response = send_rendition_file(path, download_name, MIMETYPES[output_format], etag)
+        response.headers["Cache-Control"] = cache_control
+        return response
+    
+    # Create a BytesIO object from the rendered data
+    data, encoding = compress_for_client(data, output_format)
+    buffer = BytesIO(data)
+    buffer.seek(0)
+    
+    # Return the file
+    response = send_file(
+        buffer,
+        as_attachment=True,
+        download_name=download_name,
+        mimetype=MIMETYPES[output_format],
+        etag=f"{etag}-gzip" if encoding else etag
+    )
+    if encoding:
+        response.content_encoding = encoding
+    if output_format in COMPRESSIBLE_FORMATS:
+        response.vary.add("Accept-Encoding")
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+def build_batch_items(data, output_format):
+    """Turn a batch request's label_ids and inline labels into BatchItems; returns (items, error)"""
+    label_ids = data.get('label_ids', [])
+    payloads = data.get('labels', [])
+    
+    if not isinstance(label_ids, list) or not isinstance(payloads, list):
+        return None, "label_ids and labels must be lists"
+    if not label_ids and not payloads:
+        return None, "No labels provided"
+    if len(label_ids) + len(payloads) > BATCH_RENDER_MAX_ITEMS:
+        return None, f"A batch can contain at most {BATCH_RENDER_MAX_ITEMS} labels"
+    if not all(isinstance(label_id, int) for label_id in label_ids):
+        return None, "label_ids must be integers"
+    
+    # Load every requested label in one query (duplicates are rendered once)
+    label_ids = list(dict.fromkeys(label_ids))
+    labels = {}
+    if label_ids:
+        db = get_request_db()
+        for label in db.query(NutritionLabel).filter(NutritionLabel.id.in_(label_ids)).all():
+            labels[label.id] = label
+    
+    # Missing labels and bad payloads become per-item errors in the manifest
+    items = []
+    for label_id in label_ids:
+        name = f"nutrition-label-{label_id}.{output_format}"
+        source = {"id": label_id}
+        label = labels.get(label_id)
+        if label is None:
+            items.append(BatchItem(name, error="Label not found", source=source))
+        else:
+            items.append(BatchItem(name, label.to_label_data(), label.label_format, source=source))
+    
+    for index, payload in enumerate(payloads):
+        name = f"nutrition-label-inline-{index + 1}.{output_format}"
+        source = {"index": index}
+        if not isinstance(payload, dict):
+            items.append(BatchItem(name, error="Label payload must be an object", source=source))
+        else:
+            items.append(BatchItem(name, LabelData.from_payload(payload), payload.get('format', 'standard'), source=source))
+    
+    return items, None
+
 # Route for the main page
 @api_bp.route('/')
 def index():
@@ -20,6 +229,37 @@ def index():
 def health_check():
     return jsonify({"status": "healthy"})
 
+# Readiness check: 503 until this process has warmed up its renderers
+@api_bp.route('/api/ready')
+def readiness_check():
+    ensure_warm_up(current_app._get_current_object())
+    # One snapshot decides both the status code and the body
+    stats = warm_up_stats()
+    if not stats["ready"]:
+        return jsonify(dict(stats, status="warming up")), 503
+    return jsonify(dict(stats, status="ready"))
+
+# Render, font and label cache counters, and render time and size per quality tier
+@api_bp.route('/api/cache/stats')
+def cache_stats():
+    return jsonify({
+        "render_cache": render_cache.stats(),
+        "font_cache": font_cache_stats(),
+        "render_tiers": render_tier_stats(),
+        "preview_sessions": preview_sessions.stats(),
+        "label_cache": get_label_cache().stats()
+    })
+
+# Connection pool occupancy and checkout waits for this worker process
+@api_bp.route('/api/db/stats')
+def db_stats():
+    return jsonify(pool_stats())
+
+# Request and per-stage timing histograms in the Prometheus text format
+@api_bp.route('/metrics')
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
 # API route to save a nutrition label
 @api_bp.route('/api/labels', methods=['POST'])
 def create_label():
@@ -31,35 +271,19 @@ def create_label():
             return jsonify({"error": "No data provided"}), 400
         
         # Access the database session
-        db = next(get_db())
+        db = get_request_db()
         
         # Create a new nutrition label in the database
-        new_label = NutritionLabel(
-            product_name=data.get('product_name', ''),
-            serving_size=data.get('serving_size', ''),
-            servings_per_container=data.get('servings_per_container', ''),
-            calories=data.get('calories', ''),
-            total_fat=data.get('total_fat', ''),
-            saturated_fat=data.get('saturated_fat', ''),
-            trans_fat=data.get('trans_fat', ''),
-            cholesterol=data.get('cholesterol', ''),
-            sodium=data.get('sodium', ''),
-            total_carbs=data.get('total_carbs', ''),
-            dietary_fiber=data.get('dietary_fiber', ''),
-            total_sugars=data.get('total_sugars', ''),
-            added_sugars=data.get('added_sugars', ''),
-            protein=data.get('protein', ''),
-            vitamin_d=data.get('vitamin_d', ''),
-            calcium=data.get('calcium', ''),
-            iron=data.get('iron', ''),
-            potassium=data.get('potassium', ''),
-            label_format=data.get('format', 'standard')
-        )
+        label = LabelData.from_payload(data)
+        new_label = NutritionLabel.from_label_data(label, data.get('format', 'standard'))
         
         db.add(new_label)
         db.commit()
         db.refresh(new_label)
         
+        # Render the configured downloads in the background when PRERENDER_ON_SAVE is on
+        prerender_label(new_label.id, label, new_label.label_format)
+        
         # Return the created label
         return jsonify({
             "message": "Label created successfully",
@@ -69,44 +293,41 @@ def create_label():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# API route to load many labels at once from a JSON array, NDJSON or CSV body
+@api_bp.route('/api/labels/bulk', methods=['POST'])
+def bulk_create_labels():
+    try:
+        # The body is parsed as it is read, so large catalogs never sit in memory whole
+        rows = iter_bulk_rows(request.stream, request.content_type)
+        if rows is None:
+            return jsonify({"error": "Send application/json, application/x-ndjson or text/csv"}), 415
+        
+        # Access the database session
+        db = get_request_db()
+        
+        # Valid rows are inserted in chunks; invalid ones are reported by row number
+        result = bulk_insert_labels(db, rows)
+        if not result["inserted"]:
+            result["error"] = "No labels were inserted"
+            return jsonify(result), 400
+        
+        return jsonify(result), 201 if not result["failed"] else 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # API route to get a specific label
 @api_bp.route('/api/labels/<int:label_id>', methods=['GET'])
 def get_label(label_id):
     try:
-        # Access the database session
-        db = next(get_db())
-        
-        # Get the label from the database
-        label = db.query(NutritionLabel).filter(NutritionLabel.id == label_id).first()
+        # Hot labels come from the label cache; misses read the database
+        label = get_label_cache().get(get_request_db(), label_id)
         
         if not label:
             return jsonify({"error": "Label not found"}), 404
         
-        # Convert the label to a dictionary
-        label_dict = {
-            "id": label.id,
-            "product_name": label.product_name,
-            "serving_size": label.serving_size,
-            "servings_per_container": label.servings_per_container,
-            "calories": label.calories,
-            "total_fat": label.total_fat,
-            "saturated_fat": label.saturated_fat,
-            "trans_fat": label.trans_fat,
-            "cholesterol": label.cholesterol,
-            "sodium": label.sodium,
-            "total_carbs": label.total_carbs,
-            "dietary_fiber": label.dietary_fiber,
-            "total_sugars": label.total_sugars,
-            "added_sugars": label.added_sugars,
-            "protein": label.protein,
-            "vitamin_d": label.vitamin_d,
-            "calcium": label.calcium,
-            "iron": label.iron,
-            "potassium": label.potassium,
-            "format": label.label_format
-        }
-        
-        return jsonify(label_dict), 200
+        # The cached label carries its encoded JSON body
+        return Response(label.json, mimetype="application/json")
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -115,22 +336,62 @@ def get_label(label_id):
 @api_bp.route('/api/labels', methods=['GET'])
 def list_labels():
     try:
+        # Page size, capped so a single request can't serialize the whole table
+        try:
+            limit = int(request.args.get('limit', LABEL_LIST_DEFAULT_LIMIT))
+            after = int(request.args.get('after', 0))
+        except ValueError:
+            return jsonify({"error": "limit and after must be integers"}), 400
+        if limit < 1:
+            return jsonify({"error": "limit must be at least 1"}), 400
+        limit = min(limit, LABEL_LIST_MAX_LIMIT)
+        
         # Access the database session
-        db = next(get_db())
+        db = get_request_db()
         
-        # Get all labels from the database
-        labels = db.query(NutritionLabel).all()
+        # Only select the columns we return, and page by id after the cursor
+        query = (
+            db.query(NutritionLabel.id, NutritionLabel.product_name, NutritionLabel.label_format)
+            .filter(NutritionLabel.id > after)
+        )
+        
+        # Prefix search on the indexed product name, and an exact format filter
+        prefix = request.args.get('q')
+        if prefix:
+            query = query.filter(NutritionLabel.product_name.startswith(prefix, autoescape=True))
+        label_format = request.args.get('format')
+        if label_format:
+            query = query.filter(NutritionLabel.label_format == label_format)
+        
+        # Range filters on the numeric amounts, e.g. ?min_sodium=600 or ?max_calories=200
+        for field, column in NUMERIC_COLUMNS.items():
+            for bound, compare in (("min_", operator.ge), ("max_", operator.le)):
+                raw = request.args.get(bound + field)
+                if raw is None:
+                    continue
+                number, ok = parse_amount(raw)
+                if number is None:
+                    return jsonify({"error": f"{bound}{field} must be a number"}), 400
+                query = query.filter(compare(getattr(NutritionLabel, column), number))
+        
+        # Fetch one extra row to know whether another page follows
+        rows = query.order_by(NutritionLabel.id).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
         
         # Convert the labels to a list of dictionaries
         labels_list = []
-        for label in labels:
+        for label_id, product_name, label_format in rows:
             labels_list.append({
-                "id": label.id,
-                "product_name": label.product_name,
-                "format": label.label_format
+                "id": label_id,
+                "product_name": product_name,
+                "format": label_format
             })
         
-        return jsonify(labels_list), 200
+        return jsonify({
+            "labels": labels_list,
+            "next_cursor": rows[-1].id if has_more else None
+        }), 200
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -139,51 +400,14 @@ def list_labels():
 @api_bp.route('/api/labels/<int:label_id>/pdf', methods=['GET'])
 def download_label_pdf(label_id):
     try:
-        # Access the database session
-        db = next(get_db())
-        
-        # Get the label from the database
-        label = db.query(NutritionLabel).filter(NutritionLabel.id == label_id).first()
+        # Hot labels come from the label cache; misses read the database
+        label = get_label_cache().get(get_request_db(), label_id)
         
         if not label:
             return jsonify({"error": "Label not found"}), 404
         
-        # Convert the label to a dictionary
-        label_dict = {
-            "product_name": label.product_name,
-            "serving_size": label.serving_size,
-            "servings_per_container": label.servings_per_container,
-            "calories": label.calories,
-            "total_fat": label.total_fat,
-            "saturated_fat": label.saturated_fat,
-            "trans_fat": label.trans_fat,
-            "cholesterol": label.cholesterol,
-            "sodium": label.sodium,
-            "total_carbs": label.total_carbs,
-            "dietary_fiber": label.dietary_fiber,
-            "total_sugars": label.total_sugars,
-            "added_sugars": label.added_sugars,
-            "protein": label.protein,
-            "vitamin_d": label.vitamin_d,
-            "calcium": label.calcium,
-            "iron": label.iron,
-            "potassium": label.potassium
-        }
-        
-        # Generate the PDF
-        pdf_data = create_nutrition_label_pdf(label_dict, label.label_format)
-        
-        # Create a BytesIO object from the PDF data
-        pdf_buffer = BytesIO(pdf_data)
-        pdf_buffer.seek(0)
-        
-        # Return the PDF file
-        return send_file(
-            pdf_buffer,
-            as_attachment=True,
-            download_name=f"nutrition-label-{label_id}.pdf",
-            mimetype="application/pdf"
-        )
+        # Send the PDF file (304 if the client already has this version)
+        return send_label_download(label_id, label.data, label.format_type, "pdf")
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -192,51 +416,20 @@ def download_label_pdf(label_id):
 @api_bp.route('/api/labels/<int:label_id>/png', methods=['GET'])
 def download_label_png(label_id):
     try:
-        # Access the database session
-        db = next(get_db())
+        # Size and quality tier, e.g. ?quality=print or ?width=250
+        try:
+            options = request_render_options()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Get the label from the database
-        label = db.query(NutritionLabel).filter(NutritionLabel.id == label_id).first()
+        # Hot labels come from the label cache; misses read the database
+        label = get_label_cache().get(get_request_db(), label_id)
         
         if not label:
             return jsonify({"error": "Label not found"}), 404
         
-        # Convert the label to a dictionary
-        label_dict = {
-            "product_name": label.product_name,
-            "serving_size": label.serving_size,
-            "servings_per_container": label.servings_per_container,
-            "calories": label.calories,
-            "total_fat": label.total_fat,
-            "saturated_fat": label.saturated_fat,
-            "trans_fat": label.trans_fat,
-            "cholesterol": label.cholesterol,
-            "sodium": label.sodium,
-            "total_carbs": label.total_carbs,
-            "dietary_fiber": label.dietary_fiber,
-            "total_sugars": label.total_sugars,
-            "added_sugars": label.added_sugars,
-            "protein": label.protein,
-            "vitamin_d": label.vitamin_d,
-            "calcium": label.calcium,
-            "iron": label.iron,
-            "potassium": label.potassium
-        }
-        
-        # Generate the PNG image
-        png_data = create_nutrition_label_image(label_dict, label.label_format, "png")
-        
-        # Create a BytesIO object from the PNG data
-        png_buffer = BytesIO(png_data)
-        png_buffer.seek(0)
-        
-        # Return the PNG file
-        return send_file(
-            png_buffer,
-            as_attachment=True,
-            download_name=f"nutrition-label-{label_id}.png",
-            mimetype="image/png"
-        )
+        # Send the PNG file (304 if the client already has this version)
+        return send_label_download(label_id, label.data, label.format_type, "png", options)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -245,50 +438,147 @@ def download_label_png(label_id):
 @api_bp.route('/api/labels/<int:label_id>/jpg', methods=['GET'])
 def download_label_jpg(label_id):
     try:
-        # Access the database session
-        db = next(get_db())
+        # Size and quality tier, e.g. ?quality=print or ?width=250
+        try:
+            options = request_render_options()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # Hot labels come from the label cache; misses read the database
+        label = get_label_cache().get(get_request_db(), label_id)
+        
+        if not label:
+            return jsonify({"error": "Label not found"}), 404
+        
+        # Send the JPG file (304 if the client already has this version)
+        return send_label_download(label_id, label.data, label.format_type, "jpg", options)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to download a label as SVG
+@api_bp.route('/api/labels/<int:label_id>/svg', methods=['GET'])
+def download_label_svg(label_id):
+    try:
+        # Display size, e.g. ?width=250 (the drawing itself is vector)
+        try:
+            options = request_render_options()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         
-        # Get the label from the database
-        label = db.query(NutritionLabel).filter(NutritionLabel.id == label_id).first()
+        # Hot labels come from the label cache; misses read the database
+        label = get_label_cache().get(get_request_db(), label_id)
         
         if not label:
             return jsonify({"error": "Label not found"}), 404
         
-        # Convert the label to a dictionary
-        label_dict = {
-            "product_name": label.product_name,
-            "serving_size": label.serving_size,
-            "servings_per_container": label.servings_per_container,
-            "calories": label.calories,
-            "total_fat": label.total_fat,
-            "saturated_fat": label.saturated_fat,
-            "trans_fat": label.trans_fat,
-            "cholesterol": label.cholesterol,
-            "sodium": label.sodium,
-            "total_carbs": label.total_carbs,
-            "dietary_fiber": label.dietary_fiber,
-            "total_sugars": label.total_sugars,
-            "added_sugars": label.added_sugars,
-            "protein": label.protein,
-            "vitamin_d": label.vitamin_d,
-            "calcium": label.calcium,
-            "iron": label.iron,
-            "potassium": label.potassium
-        }
-        
-        # Generate the JPG image
-        jpg_data = create_nutrition_label_image(label_dict, label.label_format, "jpg")
-        
-        # Create a BytesIO object from the JPG data
-        jpg_buffer = BytesIO(jpg_data)
-        jpg_buffer.seek(0)
-        
-        # Return the JPG file
+        # Send the SVG file (304 if the client already has this version)
+        return send_label_download(label_id, label.data, label.format_type, "svg", options)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to render many labels into one ZIP archive
+@api_bp.route('/api/labels/batch-render', methods=['POST'])
+def batch_render_labels():
+    try:
+        data = request.json
+        
+        # Validate the request data
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        output_format = normalize_output_format(data.get('output_format', 'png'))
+        items, error = build_batch_items(data, output_format)
+        if error is not None:
+            return jsonify({"error": error}), 400
+        
+        # Stream the archive as labels finish rendering on the worker pool
+        return Response(
+            stream_with_context(stream_zip(batch_archive_entries(items, output_format))),
+            mimetype="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="nutrition-labels.zip"'}
+        )
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to print many saved labels on a grid in one PDF
+@api_bp.route('/api/labels/sheet', methods=['POST'])
+def download_label_sheet():
+    try:
+        data = request.json
+        
+        # Validate the request data
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        label_ids = data.get('label_ids', [])
+        columns = data.get('columns', 2)
+        rows = data.get('rows', 2)
+        
+        if not isinstance(label_ids, list) or not label_ids:
+            return jsonify({"error": "No labels provided"}), 400
+        if len(label_ids) > BATCH_RENDER_MAX_ITEMS:
+            return jsonify({"error": f"A sheet can contain at most {BATCH_RENDER_MAX_ITEMS} labels"}), 400
+        if not all(isinstance(label_id, int) for label_id in label_ids):
+            return jsonify({"error": "label_ids must be integers"}), 400
+        if not isinstance(columns, int) or not isinstance(rows, int) or not (1 <= columns <= 4 and 1 <= rows <= 4):
+            return jsonify({"error": "columns and rows must be between 1 and 4"}), 400
+        
+        # Access the database session
+        db = get_request_db()
+        
+        # Load every requested label in one query
+        labels = {}
+        for label in db.query(NutritionLabel).filter(NutritionLabel.id.in_(label_ids)).all():
+            labels[label.id] = label
+        
+        missing = [label_id for label_id in label_ids if label_id not in labels]
+        if missing:
+            return jsonify({"error": "Label not found", "missing": missing}), 404
+        
+        # Build the whole catalog in a single document, in the order requested
+        # (ReportLab is imported here rather than at app startup)
+        from app.utils.pdf_generator import create_label_sheet_pdf
+        pdf_data = create_label_sheet_pdf(
+            [(labels[label_id].to_label_data(), labels[label_id].label_format) for label_id in label_ids],
+            columns=columns,
+            rows=rows
+        )
+        
+        # Create a BytesIO object from the PDF data
+        pdf_buffer = BytesIO(pdf_data)
+        pdf_buffer.seek(0)
+        
+        # Return the PDF file
         return send_file(
-            jpg_buffer,
+            pdf_buffer,
             as_attachment=True,
-            download_name=f"nutrition-label-{label_id}.jpg",
-            mimetype="image/jpeg"
+            download_name="nutrition-label-sheet.pdf",
+            mimetype="application/pdf"
+        )
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to export every saved label as one ZIP archive
+@api_bp.route('/api/labels/export.zip', methods=['GET'])
+def export_labels():
+    try:
+        output_format = normalize_output_format(request.args.get('format', 'png'))
+        
+        # The rows are read while the response streams, after the request's
+        # own session has been torn down, so the stream owns its session
+        db = SessionLocal()
+        
+        # Rows are read in chunks and each entry is written to the response as
+        # soon as it is rendered, so memory stays flat however many labels exist
+        entries = batch_archive_entries(iter_label_items(db, NutritionLabel, output_format), output_format)
+        return Response(
+            stream_with_context(close_when_done(stream_zip(entries), db)),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="nutrition-labels-{output_format}.zip"'}
         )
         
     except Exception as e:
@@ -304,56 +594,220 @@ def preview_label():
         if not data:
             return jsonify({"error": "No data provided"}), 400
         
-        format_type = data.get('format', 'standard')
-        output_format = data.get('output_format', 'png')
-        
-        # Create a dictionary with the label data
-        label_dict = {
-            "product_name": data.get('product_name', ''),
-            "serving_size": data.get('serving_size', ''),
-            "servings_per_container": data.get('servings_per_container', ''),
-            "calories": data.get('calories', ''),
-            "total_fat": data.get('total_fat', ''),
-            "saturated_fat": data.get('saturated_fat', ''),
-            "trans_fat": data.get('trans_fat', ''),
-            "cholesterol": data.get('cholesterol', ''),
-            "sodium": data.get('sodium', ''),
-            "total_carbs": data.get('total_carbs', ''),
-            "dietary_fiber": data.get('dietary_fiber', ''),
-            "total_sugars": data.get('total_sugars', ''),
-            "added_sugars": data.get('added_sugars', ''),
-            "protein": data.get('protein', ''),
-            "vitamin_d": data.get('vitamin_d', ''),
-            "calcium": data.get('calcium', ''),
-            "iron": data.get('iron', ''),
-            "potassium": data.get('potassium', '')
-        }
-        
-        # Generate the image
-        if output_format.lower() == 'pdf':
-            image_data = create_nutrition_label_pdf(label_dict, format_type)
-            mimetype = "application/pdf"
-            filename = "nutrition-label-preview.pdf"
-        elif output_format.lower() == 'jpg':
-            image_data = create_nutrition_label_image(label_dict, format_type, "jpg")
-            mimetype = "image/jpeg"
-            filename = "nutrition-label-preview.jpg"
-        else:  # Default to PNG
-            image_data = create_nutrition_label_image(label_dict, format_type, "png")
-            mimetype = "image/png"
-            filename = "nutrition-label-preview.png"
-        
-        # Create a BytesIO object from the image data
+        # The format and output type may come in the body or the query string
+        format_type = data.get('format') or request.args.get('format', 'standard')
+        output_format = data.get('output_format') or request.args.get('output_format', 'png')
+        
+        # Previews can ask for a cheaper tier, e.g. ?quality=preview&output_format=webp
+        try:
+            options = request_render_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        # The label data, parsed once for the cache key and the renderer
+        label = LabelData.from_payload(data)
+        
+        # Generate the image. Repeat previews of the same payload come from the
+        # render cache, identical previews in flight share one render, and the
+        # render is dropped if the browser gives up on it first.
+        output_format = normalize_output_format(output_format)
+        try:
+            image_data = render_label(label, format_type, output_format, options, client_disconnect_check())
+        except RenderCancelled:
+            # Nobody reads this; 499 is what nginx logs for "client closed request"
+            return "", 499
+        mimetype = MIMETYPES[output_format]
+        filename = f"nutrition-label-preview.{output_format}"
+        
+        # Create a BytesIO object from the image data (SVG goes out gzipped when accepted)
+        image_data, encoding = compress_for_client(image_data, output_format)
         buffer = BytesIO(image_data)
         buffer.seek(0)
         
         # Return the image file
-        return send_file(
+        response = send_file(
             buffer,
             as_attachment=True,
             download_name=filename,
             mimetype=mimetype
         )
+        if encoding:
+            response.content_encoding = encoding
+        if output_format in COMPRESSIBLE_FORMATS:
+            response.vary.add("Accept-Encoding")
+        return response
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to open an incremental preview: renders the label once and keeps the canvas
+@api_bp.route('/api/preview/sessions', methods=['POST'])
+def open_preview_session():
+    try:
+        data = request.json
+        
+        # Validate the request data
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        format_type = data.get('format') or request.args.get('format', 'standard')
+        output_format = normalize_output_format(data.get('output_format') or request.args.get('output_format', 'png'))
+        if output_format in ("pdf", "svg"):
+            # SVG previews are cheap enough to render whole; see POST /api/preview
+            return jsonify({"error": "Preview sessions render raster images; use png, jpg or webp"}), 400
+        
+        try:
+            options = request_render_options(data)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        tag_render(format_type, output_format)
+        try:
+            session_id, image_data = preview_sessions.open(LabelData.from_payload(data), format_type, output_format, options)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        response = send_file(BytesIO(image_data), mimetype=MIMETYPES[output_format])
+        response.status_code = 201
+        response.headers["X-Preview-Session"] = session_id
+        response.headers["Location"] = f"/api/preview/sessions/{session_id}"
+        return response
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to apply field edits to a preview session; only the changed rows are redrawn
+@api_bp.route('/api/preview/sessions/<session_id>', methods=['PATCH'])
+def update_preview_session(session_id):
+    try:
+        changes = request.json
+        
+        # Validate the request data
+        if not isinstance(changes, dict) or not changes:
+            return jsonify({"error": "Send an object of changed fields"}), 400
+        unknown = sorted(set(changes) - set(LABEL_FIELDS))
+        if unknown:
+            return jsonify({"error": "Unknown fields", "fields": unknown}), 400
+        
+        # Expired sessions are 404 so the client knows to open a new one
+        result = preview_sessions.update(session_id, changes)
+        if result is None:
+            return jsonify({"error": "Preview session not found"}), 404
+        image_data, output_format, redrawn = result
+        
+        response = send_file(BytesIO(image_data), mimetype=MIMETYPES[output_format])
+        response.headers["X-Preview-Session"] = session_id
+        response.headers["X-Redrawn-Ops"] = str(redrawn)
+        return response
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to close a preview session early
+@api_bp.route('/api/preview/sessions/<session_id>', methods=['DELETE'])
+def close_preview_session(session_id):
+    if not preview_sessions.close(session_id):
+        return jsonify({"error": "Preview session not found"}), 404
+    return "", 204
+
+# API route to queue a render or batch render instead of waiting for it
+@api_bp.route('/api/jobs', methods=['POST'])
+def submit_job():
+    try:
+        data = request.json
+        
+        # Validate the request data
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        
+        job_type = data.get('type', 'render')
+        output_format = normalize_output_format(data.get('output_format', 'png'))
+        
+        try:
+            if job_type == 'batch':
+                # Same body as /api/labels/batch-render; the result is the ZIP
+                items, error = build_batch_items(data, output_format)
+                if error is not None:
+                    return jsonify({"error": error}), 400
+                job_id = submit_batch_job(items, output_format)
+            
+            elif job_type == 'render':
+                # A saved label by id, or an inline payload like /api/preview
+                label_id = data.get('label_id')
+                if label_id is not None:
+                    if not isinstance(label_id, int):
+                        return jsonify({"error": "label_id must be an integer"}), 400
+                    label = get_label_cache().get(get_request_db(), label_id)
+                    if not label:
+                        return jsonify({"error": "Label not found"}), 404
+                    job_id = submit_render_job(
+                        label.data, label.format_type, output_format,
+                        f"nutrition-label-{label_id}.{output_format}"
+                    )
+                else:
+                    job_id = submit_render_job(
+                        LabelData.from_payload(data), data.get('format', 'standard'), output_format,
+                        f"nutrition-label-preview.{output_format}"
+                    )
+            
+            else:
+                return jsonify({"error": "type must be render or batch"}), 400
+        
+        except JobQueueFull:
+            # Backpressure: tell the client when to try again instead of queueing without bound
+            response = jsonify({"error": "Too many render jobs in progress, try again later"})
+            response.headers["Retry-After"] = str(JOB_RETRY_AFTER)
+            return response, 429
+        
+        status_url = f"/api/jobs/{job_id}"
+        return jsonify({
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": status_url,
+            "result_url": f"{status_url}/result"
+        }), 202, {"Location": status_url}
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to poll a job's status and progress
+@api_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = get_job_queue().store.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        
+        job["progress"] = job["done"] / job["total"] if job["total"] else 0.0
+        if job["status"] == "done":
+            job["result_url"] = f"/api/jobs/{job_id}/result"
+        
+        return jsonify(job), 200
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# API route to download a finished job's output
+@api_bp.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    try:
+        store = get_job_queue().store
+        job = store.get(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if job["status"] != "done":
+            return jsonify({"error": "Job is not finished", "status": job["status"], "job_error": job["error"]}), 409
+        
+        # Create a BytesIO object from the job's output
+        buffer = BytesIO(store.result(job_id))
+        buffer.seek(0)
+        
+        return send_file(
+            buffer,
+            as_attachment=True,
+            download_name=job["filename"],
+            mimetype=job["mimetype"]
+        )
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
\ No newline at end of file
@@ -8,6 +8,7 @@ document.addEventListener('DOMContentLoaded', function() {
     const downloadPng = document.getElementById('downloadPng');
     const downloadJpg = document.getElementById('downloadJpg');
     const downloadPdf = document.getElementById('downloadPdf');
+    const downloadSvg = document.getElementById('downloadSvg');
     const saveLabel = document.getElementById('saveLabel');
     
     // Zoom buttons
@@ -23,6 +24,13 @@ document.addEventListener('DOMContentLoaded', function() {
     // Current label ID (when saved)
     let currentLabelId = null;
     
+    // Typing only asks for a preview once the input has been idle this long (ms)
+    const PREVIEW_DEBOUNCE_MS = 300;
+    let previewTimer = null;
+    
+    // The preview request in flight, aborted when a newer one replaces it
+    let previewController = null;
+    
     // Initialize with sample data
     const sampleData = {
         product_name: "Sample Product",
@@ -54,12 +62,26 @@ document.addEventListener('DOMContentLoaded', function() {
     // Update preview when form is submitted
     nutritionForm.addEventListener('submit', function(e) {
         e.preventDefault();
+        clearTimeout(previewTimer);
         const formData = getFormData();
         currentLabelData = formData;
         generatePreview(formData, labelFormat.value);
         showToast('Preview updated!');
     });
     
+    // Update preview as the user types, once they pause
+    nutritionForm.addEventListener('input', function(e) {
+        // The format selector has its own change handler below
+        if (e.target === labelFormat) {
+            return;
+        }
+        clearTimeout(previewTimer);
+        previewTimer = setTimeout(function() {
+            currentLabelData = getFormData();
+            generatePreview(currentLabelData, labelFormat.value);
+        }, PREVIEW_DEBOUNCE_MS);
+    });
+    
     // Update preview when format changes
     labelFormat.addEventListener('change', function() {
         if (currentLabelData) {
@@ -111,6 +133,16 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
     
+    // Handle SVG download
+    downloadSvg.addEventListener('click', function() {
+        if (currentLabelData) {
+            const format = labelFormat.value;
+            downloadImage('svg', format);
+        } else {
+            showToast('Please enter nutrition data first!', true);
+        }
+    });
+    
     // Handle save label
     saveLabel.addEventListener('click', function() {
         if (currentLabelData) {
@@ -177,19 +209,29 @@ document.addEventListener('DOMContentLoaded', function() {
      * Generate and display label preview
      */
     function generatePreview(data, format) {
-        // Show loading state
-        labelPreview.innerHTML = '<div class="text-center p-4"><div class="animate-spin rounded-full h-12 w-12 border-t-2 border-b-2 border-blue-500 mx-auto"></div><p class="mt-2 text-gray-600">Loading preview...</p></div>';
+        // Cancel the previous request; its image would be replaced anyway
+        if (previewController) {
+            previewController.abort();
+        }
+        const controller = new AbortController();
+        previewController = controller;
+        
+        // Show loading state (keep the current image while typing)
+        if (!labelPreview.querySelector('img')) {
+            labelPreview.innerHTML = '<div class="text-center p-4"><div class="animate-spin rounded-full h-12 w-12 border-t-2 border-b-2 border-blue-500 mx-auto"></div><p class="mt-2 text-gray-600">Loading preview...</p></div>';
+        }
         
         // Prepare data for the API
         const requestData = { ...data, format };
         
-        // Call preview API
-        fetch('/api/preview?format=' + format + '&output_format=png', {
+        // Call preview API (SVG: tiny, sharp at any zoom; downloads get full quality)
+        fetch('/api/preview?format=' + format + '&output_format=svg', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
-            body: JSON.stringify(requestData)
+            body: JSON.stringify(requestData),
+            signal: controller.signal
         })
         .then(response => {
             if (!response.ok) {
@@ -205,14 +247,27 @@ document.addEventListener('DOMContentLoaded', function() {
             img.className = 'max-w-full h-auto fade-in nutrition-label ' + format + '-label';
             img.alt = 'Nutrition Label Preview';
             
-            // Replace loading indicator with image
+            // Replace loading indicator (or the previous preview) with image
+            const previous = labelPreview.querySelector('img');
+            if (previous) {
+                URL.revokeObjectURL(previous.src);
+            }
             labelPreview.innerHTML = '';
             labelPreview.appendChild(img);
         })
         .catch(error => {
+            // A newer preview replaced this one; nothing to report
+            if (error.name === 'AbortError') {
+                return;
+            }
             console.error('Error:', error);
             labelPreview.innerHTML = '<div class="text-center p-4 text-red-500">Error generating preview</div>';
             showToast('Error generating preview. Please try again.', true);
+        })
+        .finally(() => {
+            if (previewController === controller) {
+                previewController = null;
+            }
         });
     }
     
@@ -230,8 +285,8 @@ document.addEventListener('DOMContentLoaded', function() {
         // Show loading toast
         showToast('Preparing download...');
         
-        // Call API to create the file
-        fetch('/api/preview?format=' + labelFormat + '&output_format=' + outputFormat, {
+        // Call API to create the file at print resolution
+        fetch('/api/preview?format=' + labelFormat + '&output_format=' + outputFormat + '&quality=print', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -0,0 +1,36 @@
+import math
+
+# Unit suffixes accepted after an amount, e.g. "140mg" or "1.5 g"
+AMOUNT_UNITS = ("kcal", "mcg", "mg", "g")
+
+def parse_amount(value):
+    """Parse a stored amount like "12", "1,200" or "140 mg"; returns (number or None, parsed ok)"""
+    if value is None or value == "":
+        return None, True
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        number = float(value)
+        return (number, True) if math.isfinite(number) else (None, False)
+    
+    # Plain numbers, by far the most common, skip the clean-up below
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        pass
+    else:
+        return (number, True) if math.isfinite(number) else (None, False)
+    
+    text = str(value).strip().lower().replace(",", "")
+    if not text:
+        return None, True
+    for unit in AMOUNT_UNITS:
+        if text.endswith(unit):
+            text = text[:-len(unit)].strip()
+            break
+    
+    try:
+        number = float(text)
+    except ValueError:
+        return None, False
+    if not math.isfinite(number):
+        return None, False
+    return number, True
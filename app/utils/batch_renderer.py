@@ -0,0 +1,171 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import json
+import multiprocessing
+import os
+import threading
+
+from .label_renderer import normalize_output_format, render_key, render_label_uncached
+from .render_cache import render_cache
+
+# Worker processes used for batch rendering, and how they are started. Spawn
+# is the default because forking a multi-threaded gunicorn worker can copy
+# held locks into the child.
+BATCH_RENDER_WORKERS = int(os.environ.get('BATCH_RENDER_WORKERS', os.cpu_count() or 1))
+BATCH_RENDER_START_METHOD = os.environ.get('BATCH_RENDER_START_METHOD', 'spawn')
+
+# Largest number of labels accepted in one batch request
+BATCH_RENDER_MAX_ITEMS = int(os.environ.get('BATCH_RENDER_MAX_ITEMS', 1000))
+
+# Rows fetched per query when exporting the whole label table
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 200))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class BatchItem:
+    """One label in a batch: its archive name and either render inputs or an error"""
+
+    __slots__ = ("name", "label", "format_type", "error", "source")
+
+    def __init__(self, name, label=None, format_type="standard", error=None, source=None):
+        self.name = name
+        self.label = label
+        self.format_type = format_type
+        self.error = error
+        self.source = source
+
+def iter_label_items(db, label_model, output_format, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield a BatchItem for every stored label, reading the table in id-ordered chunks"""
+    output_format = normalize_output_format(output_format)
+    last_id = 0
+    while True:
+        # Keyset pagination keeps each query cheap and only one chunk of rows in memory
+        labels = (
+            db.query(label_model)
+            .filter(label_model.id > last_id)
+            .order_by(label_model.id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not labels:
+            return
+
+        for label in labels:
+            yield BatchItem(
+                f"nutrition-label-{label.id}.{output_format}",
+                label.to_label_data(),
+                label.label_format,
+                source={"id": label.id}
+            )
+
+        last_id = labels[-1].id
+        # Let the session forget the rows we've already handed out
+        db.expunge_all()
+
+def get_render_pool():
+    """Return the process pool shared by batch renders, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=BATCH_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context(BATCH_RENDER_START_METHOD)
+            )
+        return _pool
+
+def _reset_render_pool():
+    # A worker died mid-render; drop the broken pool so the next batch gets a fresh one
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+def shutdown_render_pool():
+    """Stop the batch worker processes"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+
+def _submit(item, output_format):
+    # Returns (item, cache key, result) where result is cached bytes, a
+    # future for a pool render, or an error message
+    if item.error is not None:
+        return item, None, item.error
+
+    key = render_key(item.label, item.format_type, output_format)
+    data = render_cache.get(key)
+    if data is not None:
+        return item, key, data
+
+    try:
+        future = get_render_pool().submit(render_label_uncached, item.label, item.format_type, output_format)
+    except BrokenProcessPool:
+        _reset_render_pool()
+        return item, key, "Render worker crashed"
+    return item, key, future
+
+def _collect(pending):
+    item, key, result = pending
+    if isinstance(result, str):
+        return item, None, result
+    if isinstance(result, bytes):
+        return item, result, None
+
+    try:
+        data = result.result()
+    except BrokenProcessPool:
+        _reset_render_pool()
+        return item, None, "Render worker crashed"
+    except Exception as e:
+        return item, None, str(e)
+
+    render_cache.put(key, data)
+    return item, data, None
+
+def render_batch(items, output_format, max_in_flight=None):
+    """Render BatchItems on the process pool, yielding (item, data, error) in input order"""
+    output_format = normalize_output_format(output_format)
+    max_in_flight = max_in_flight or BATCH_RENDER_WORKERS * 2
+
+    # Keep a bounded window of renders in flight so finished results don't
+    # pile up in memory while earlier ones are still being streamed out
+    pending = deque()
+    for item in items:
+        pending.append(_submit(item, output_format))
+        if len(pending) >= max_in_flight:
+            yield _collect(pending.popleft())
+
+    while pending:
+        yield _collect(pending.popleft())
+
+def batch_archive_entries(items, output_format, progress=None):
+    """Yield (name, data) ZIP entries for a batch, ending with a manifest.json of per-item results"""
+    output_format = normalize_output_format(output_format)
+    manifest = []
+    rendered = 0
+
+    for item, data, error in render_batch(items, output_format):
+        if progress is not None:
+            progress(len(manifest) + 1)
+        entry = dict(item.source or {}, filename=item.name)
+        if error is None:
+            rendered += 1
+            entry["status"] = "ok"
+            yield item.name, data
+        else:
+            entry["status"] = "error"
+            entry["filename"] = None
+            entry["error"] = error
+        manifest.append(entry)
+
+    yield "manifest.json", json.dumps({
+        "output_format": output_format,
+        "rendered": rendered,
+        "failed": len(manifest) - rendered,
+        "items": manifest
+    }, indent=2).encode("utf-8")
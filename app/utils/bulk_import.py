@@ -0,0 +1,310 @@
+import codecs
+import csv
+import io
+import json
+import os
+import re
+
+from sqlalchemy import insert
+
+from ..models.database import NutritionLabel
+from ..models.label_data import LABEL_FIELDS, LabelData
+from .label_layout import LABEL_FORMATS
+
+# Valid rows inserted per statement and transaction
+BULK_INSERT_CHUNK_SIZE = int(os.environ.get('BULK_INSERT_CHUNK_SIZE', 1000))
+
+# Bytes read from the request body at a time
+BULK_READ_SIZE = 64 * 1024
+
+# Longest a single label in a JSON array may be (characters), so an element
+# that never ends is rejected instead of being read to the end of the body
+BULK_MAX_ELEMENT_CHARS = 1024 * 1024
+
+# Content types accepted by the bulk endpoint and the parser for each
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines")
+CSV_TYPES = ("text/csv", "application/csv")
+
+class BulkParseError(Exception):
+    """The request body stopped being valid JSON, NDJSON or CSV partway through"""
+
+def _read_text(stream):
+    # Decode the body in fixed-size chunks so multi-byte characters split
+    # across a chunk boundary come out whole
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    while True:
+        chunk = stream.read(BULK_READ_SIZE)
+        if not chunk:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+
+def iter_json_array(stream):
+    """Yield the elements of a top-level JSON array without reading the whole body"""
+    reader = _ArrayReader(_read_text(stream))
+    if reader.next_char() != "[":
+        raise BulkParseError("Expected a JSON array of labels")
+
+    if reader.peek_char() == "]":
+        reader.position += 1
+    else:
+        while True:
+            yield reader.element()
+            # Exactly one separator between elements, and no trailing comma
+            separator = reader.next_char()
+            if separator == "]":
+                break
+            if separator != ",":
+                raise BulkParseError("Invalid JSON: Expecting ',' delimiter" if separator else "Unexpected end of JSON array")
+            if reader.peek_char() in ("]", ","):
+                raise BulkParseError("Invalid JSON: Expecting value")
+
+    if reader.peek_char():
+        raise BulkParseError("Invalid JSON: Extra data after the array")
+
+# Where the text of an element can end: a structural character, a quote
+# or (for numbers and literals) whitespace; inside strings, a quote or escape
+_ELEMENT_SPECIAL = re.compile(r'["{}\[\],\s]')
+_NESTED_SPECIAL = re.compile(r'["{}\[\]]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+class _ArrayReader:
+    """Buffered text of a JSON array body, read a chunk at a time"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+    def read_more(self, keep_from):
+        """Append the next chunk, dropping text before keep_from; returns how far indices moved, or None at the end"""
+        more = next(self.chunks, "")
+        if not more:
+            return None
+        self.buffer = self.buffer[keep_from:] + more
+        self.position -= keep_from
+        return keep_from
+
+    def peek_char(self):
+        """Return the next non-whitespace character without consuming it ('' at the end)"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position].isspace():
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if self.read_more(self.position) is None:
+                return ""
+
+    def next_char(self):
+        char = self.peek_char()
+        self.position += len(char)
+        return char
+
+    def element(self):
+        """Decode the next element; only an element cut off by the chunk boundary reads more"""
+        first = self.peek_char()
+        if not first:
+            raise BulkParseError("Unexpected end of JSON array")
+
+        # Objects, arrays and strings end with their own closing character,
+        # so one that decodes is complete; the rest go through the scan below
+        if first in '{["':
+            try:
+                value, self.position = self.decoder.raw_decode(self.buffer, self.position)
+                return value
+            except json.JSONDecodeError:
+                pass
+
+        # Find where the element ends before decoding it, so a bad element
+        # fails at once instead of pulling in the rest of the body
+        start = self.position
+        index = start
+        depth = 0
+        in_string = False
+        while True:
+            if in_string:
+                pattern = _STRING_SPECIAL
+            else:
+                pattern = _NESTED_SPECIAL if depth else _ELEMENT_SPECIAL
+            match = pattern.search(self.buffer, index)
+            # A backslash needs the character after it, which may be in the next chunk
+            if match is None or (match.group() == "\\" and match.end() == len(self.buffer)):
+                index = match.start() if match is not None else len(self.buffer)
+                if index - start > BULK_MAX_ELEMENT_CHARS:
+                    raise BulkParseError(f"A label is longer than {BULK_MAX_ELEMENT_CHARS} characters")
+                moved = self.read_more(start)
+                if moved is None:
+                    if in_string or depth:
+                        raise BulkParseError("Unexpected end of JSON array")
+                    # A number or literal running up to the end of the body
+                    end = len(self.buffer)
+                    break
+                # Resume where the scan stopped, not from the element's start
+                start -= moved
+                index -= moved
+                continue
+
+            char = match.group()
+            index = match.end()
+            if in_string:
+                if char == "\\":
+                    index += 1
+                elif not depth:
+                    end = index
+                    break
+                else:
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char in "{[":
+                depth += 1
+            elif char in "}]" and depth:
+                depth -= 1
+                if not depth:
+                    end = index
+                    break
+            else:
+                # A comma, whitespace or bracket right after a number or literal
+                end = match.start()
+                break
+
+        try:
+            value, decoded_end = self.decoder.raw_decode(self.buffer, start)
+        except json.JSONDecodeError as e:
+            raise BulkParseError(f"Invalid JSON: {e.msg}")
+        if decoded_end != end:
+            raise BulkParseError("Invalid JSON: Expecting ',' delimiter")
+        self.position = end
+        return value
+
+def iter_ndjson(stream):
+    """Yield one parsed value, or a BulkParseError, per non-blank line"""
+    pending = ""
+    for text in _read_text(stream):
+        lines = (pending + text).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                yield _parse_json_line(line)
+    if pending.strip():
+        yield _parse_json_line(pending)
+
+def _parse_json_line(line):
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError as e:
+        return BulkParseError(f"Invalid JSON: {e.msg}")
+
+def iter_csv(stream):
+    """Yield one dictionary per CSV row, keyed by the header row"""
+    text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    try:
+        yield from csv.DictReader(text)
+    except csv.Error as e:
+        raise BulkParseError(f"Invalid CSV: {e}")
+    finally:
+        # Don't let the wrapper close the request stream it was handed
+        text.detach()
+
+def iter_bulk_rows(stream, content_type):
+    """Pick the parser for a request content type; returns None for unsupported types"""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type == "application/json":
+        return iter_json_array(stream)
+    if content_type in NDJSON_TYPES:
+        return iter_ndjson(stream)
+    if content_type in CSV_TYPES:
+        return iter_csv(stream)
+    return None
+
+def validate_label_row(row):
+    """Return (column values, None) for a valid label row or (None, error message)"""
+    if isinstance(row, BulkParseError):
+        return None, str(row)
+    if not isinstance(row, dict):
+        return None, "Each label must be an object"
+
+    values = {}
+    for field in LABEL_FIELDS:
+        value = row.get(field)
+        if value is None:
+            value = ""
+        elif isinstance(value, bool) or not isinstance(value, (str, int, float)):
+            return None, f"{field} must be a string or number"
+        values[field] = str(value).strip()
+
+    if not values["product_name"]:
+        return None, "product_name is required"
+
+    # Amounts are parsed once, by LabelData, for the check and the numeric columns
+    label = LabelData(values[field] for field in LABEL_FIELDS)
+    if label.invalid_amounts:
+        field = label.invalid_amounts[0]
+        return None, f"{field} is not a number: {values[field]!r}"
+    values.update(label.numeric_columns())
+
+    # Rows use the same "format" key as POST /api/labels
+    label_format = row.get("format") or row.get("label_format") or "standard"
+    if label_format not in LABEL_FORMATS:
+        return None, f"Unknown format: {label_format!r}"
+    values["label_format"] = label_format
+    return values, None
+
+def _insert_chunk(db, rows):
+    # insert().returning() with a list of rows is sent as multi-row
+    # INSERT ... VALUES ... RETURNING statements on Postgres and SQLite, so
+    # a chunk costs a round trip or two and still hands back every new id
+    statement = insert(NutritionLabel.__table__).returning(
+        NutritionLabel.__table__.c.id, sort_by_parameter_order=True
+    )
+    ids = db.execute(statement, rows).scalars().all()
+    db.commit()
+    return ids
+
+def bulk_insert_labels(db, rows, chunk_size=BULK_INSERT_CHUNK_SIZE):
+    """Validate and insert label rows in chunks, returning the new ids and per-row errors"""
+    result = {"inserted": 0, "failed": 0, "ids": [], "errors": []}
+    chunk = []
+    chunk_rows = []
+
+    def flush():
+        try:
+            ids = _insert_chunk(db, chunk)
+        except Exception as e:
+            db.rollback()
+            for number in chunk_rows:
+                result["errors"].append({"row": number, "error": f"Insert failed: {e}"})
+            result["failed"] += len(chunk)
+        else:
+            result["ids"].extend(ids)
+            result["inserted"] += len(ids)
+        chunk.clear()
+        chunk_rows.clear()
+
+    number = 0
+    try:
+        for number, row in enumerate(rows, start=1):
+            values, error = validate_label_row(row)
+            if error is not None:
+                result["errors"].append({"row": number, "error": error})
+                result["failed"] += 1
+                continue
+
+            chunk.append(values)
+            chunk_rows.append(number)
+            if len(chunk) >= chunk_size:
+                flush()
+    except BulkParseError as e:
+        # Rows before the broken part are still inserted; nothing after it is read
+        result["errors"].append({"row": number + 1, "error": str(e)})
+        result["failed"] += 1
+
+    if chunk:
+        flush()
+
+    return result
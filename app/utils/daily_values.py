@@ -1,3 +1,5 @@
+from .amounts import parse_amount
+
 DAILY_VALUES = {
     "total_fat": 78,               # g
     "saturated_fat": 20,           # g
@@ -13,11 +15,93 @@ DAILY_VALUES = {
 }
 
 def calculate_dv(value, dv_reference):
-    """Calculate the daily value percentage with 2 decimal places"""
-    if not value or not dv_reference:
+    """Calculate the daily value percentage with 2 decimal places from an amount like "140" or "140 mg" (0 when blank or unparseable)"""
+    return dv_from_amount(parse_amount(value)[0], dv_reference)
+
+def dv_from_amount(amount, dv_reference):
+    """Calculate the daily value percentage from an amount parse_amount already parsed (None when blank or unparseable)"""
+    if amount is None or not dv_reference:
         return 0
     
+    return round(amount / dv_reference * 100, 2)
+
+def columns_from_labels(labels):
+    """Turn a list of label dictionaries into {nutrient: [value per label]} columns"""
+    return {nutrient: [label.get(nutrient) for label in labels] for nutrient in DAILY_VALUES}
+
+def _parse_column(np, values):
+    """Parse one column to float64 like parse_amount, returning (values, mask of unparseable entries)"""
+    array = np.asarray(values)
+    
+    # Numeric columns need no parsing; only NaN and infinity are invalid
+    if array.dtype.kind in "biuf":
+        parsed = array.astype(np.float64)
+        mask = ~np.isfinite(parsed)
+        parsed[mask] = 0.0
+        return parsed, mask
+    
+    # Everything else: plain numbers go through float() in one pass and blank
+    # values count as 0 (like calculate_dv); NaN and infinity are masked, as
+    # parse_amount rejects them
     try:
-        return round(float(value) / dv_reference * 100, 2)
+        parsed = np.fromiter((float(value) if value else 0.0 for value in values), dtype=np.float64, count=len(values))
     except (ValueError, TypeError):
-        return 0
\ No newline at end of file
+        pass
+    else:
+        mask = ~np.isfinite(parsed)
+        parsed[mask] = 0.0
+        return parsed, mask
+    
+    # Units, thousands separators or unparseable values somewhere in the
+    # column: parse value by value
+    parsed = np.zeros(len(values), dtype=np.float64)
+    mask = np.zeros(len(values), dtype=bool)
+    for index, value in enumerate(values):
+        number, ok = parse_amount(value)
+        if not ok:
+            mask[index] = True
+        elif number is not None:
+            parsed[index] = number
+    return parsed, mask
+
+def _round_like_python(np, percentages):
+    """Round to 2 decimals exactly as round(value, 2) does"""
+    # numpy rounds by scaling, which can land on the wrong side of a tie that
+    # Python's correctly rounded round() resolves differently. Only values
+    # that scale to (almost exactly) x.5 are affected, so redo just those.
+    scaled = percentages * 100
+    rounded = np.rint(scaled) / 100
+    with np.errstate(invalid="ignore"):
+        near_tie = np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <= 1e-9 * np.maximum(1.0, np.abs(scaled))
+    for index in np.flatnonzero(near_tie):
+        rounded[index] = round(float(percentages[index]), 2)
+    return rounded
+
+def calculate_dv_batch(columns):
+    """Calculate %DVs for many labels at once from {nutrient: [value per label]} columns.
+    
+    Values are parsed with parse_amount and rounded exactly like calculate_dv,
+    so each %DV matches the label's own. Returns {nutrient: numpy masked
+    array} with the values parse_amount rejects masked instead of becoming
+    0. Requires numpy.
+    """
+    # Imported here so the scalar path and app startup don't pay for numpy
+    import numpy as np
+    
+    results = {}
+    length = None
+    for nutrient, values in columns.items():
+        if nutrient not in DAILY_VALUES:
+            continue
+        
+        parsed, mask = _parse_column(np, values)
+        if length is None:
+            length = len(parsed)
+        elif len(parsed) != length:
+            raise ValueError("All nutrient columns must have the same length")
+        
+        with np.errstate(invalid="ignore", over="ignore"):
+            percentages = parsed / DAILY_VALUES[nutrient] * 100
+        results[nutrient] = np.ma.masked_array(_round_like_python(np, percentages), mask=mask)
+    
+    return results
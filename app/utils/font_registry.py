@@ -0,0 +1,59 @@
+import os
+import threading
+
+# Default font paths - we'll use DejaVuSans fonts which are usually available in Linux
+REGULAR_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
+BOLD_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+
+# Fallback to a system font if the specified font is not available
+if not os.path.exists(REGULAR_FONT):
+    REGULAR_FONT = "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"
+    BOLD_FONT = "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf"
+
+FONT_FACES = {
+    "regular": REGULAR_FONT,
+    "bold": BOLD_FONT
+}
+
+# Fonts loaded so far, keyed by (face, size). Pillow font objects are read-only
+# once created and glyph rendering runs under the GIL, so a single instance per
+# process can be shared by every request thread.
+_fonts = {}
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def get_font(face, size):
+    """Return the font for a face ("regular" or "bold") and size, loading it once per process"""
+    key = (face, size)
+    with _lock:
+        font = _fonts.get(key)
+        if font is not None:
+            _stats["hits"] += 1
+            return font
+
+        _stats["misses"] += 1
+        # Pillow is imported with the first font so app startup doesn't load it
+        from PIL import ImageFont
+        try:
+            font = ImageFont.truetype(FONT_FACES[face], size)
+        except IOError:
+            # Fallback to default font if custom font not found
+            font = ImageFont.load_default()
+        _fonts[key] = font
+        return font
+
+def font_cache_stats():
+    """Return hit/miss counters and the number of fonts currently loaded"""
+    with _lock:
+        return {
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "loaded": len(_fonts)
+        }
+
+def clear_font_cache():
+    """Drop every loaded font and reset the counters"""
+    with _lock:
+        _fonts.clear()
+        _stats["hits"] = 0
+        _stats["misses"] = 0
@@ -1,361 +1,279 @@
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
+from collections import OrderedDict
+from functools import lru_cache
 from io import BytesIO
-from .daily_values import DAILY_VALUES, calculate_dv
+from .font_registry import get_font
+from .label_layout import BASE_DPI, FONTS, LABEL_FORMATS, get_layout, label_values
+from .label_renderer import QUALITY_TIERS
+from .stage_timing import stage
+from string import Formatter
 import os
+import threading
 
-# Get base directory for font access
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-FONT_DIR = os.path.join(BASE_DIR, 'app', 'static', 'fonts')
+# Memory budget for the base images holding the static artwork of each
+# layout, keyed by (layout, image mode, scale). Bounded by bytes because
+# scales come from request parameters and the largest canvas is ~25 MB.
+CHROME_CACHE_MAX_BYTES = int(os.environ.get('CHROME_CACHE_MAX_BYTES', 96 * 1024 * 1024))
+_chrome_cache = OrderedDict()
+_chrome_size = 0
+_chrome_lock = threading.Lock()
 
-# Create fonts directory if it doesn't exist
-os.makedirs(FONT_DIR, exist_ok=True)
-
-# Default font paths - we'll use DejaVuSans fonts which are usually available in Linux
-REGULAR_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf"
-BOLD_FONT = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
-
-# Fallback to a system font if the specified font is not available
-if not os.path.exists(REGULAR_FONT):
-    REGULAR_FONT = "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf"
-    BOLD_FONT = "/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf"
+# Encoder settings per quality tier: previews favour encode speed, print
+# favours fidelity
+ENCODE_SETTINGS = {
+    "preview": {"png": {"compress_level": 1}, "jpg": {"quality": 75}, "webp": {"quality": 75, "method": 0}},
+    "standard": {"png": {}, "jpg": {"quality": 95}, "webp": {"quality": 90}},
+    "print": {"png": {}, "jpg": {"quality": 95, "subsampling": 0}, "webp": {"lossless": True}}
+}
 
 # Calculate RGB from hex color
 def hex_to_rgb(hex_color):
     hex_color = hex_color.lstrip('#')
     return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
 
-def create_nutrition_label_image(nutrition_data, format_type="standard", file_format="png"):
-    """Create an image with the nutrition label in PNG or JPG format"""
-    # Set image parameters based on format
-    if format_type in ["standard", "vertical"]:
-        width = 500
-        height = 800
-    elif format_type == "horizontal":
-        width = 800
-        height = 500
-    elif format_type == "tabular":
-        width = 600
-        height = 800
-    else:  # simplified and other formats
-        width = 500
-        height = 600
-    
-    # Create image with white background (or transparent for PNG)
-    if file_format.lower() == "png":
-        # For PNG, we'll create an RGBA image with transparency
-        img = Image.new('RGBA', (width, height), (255, 255, 255, 0))
-    else:
-        # For JPG, we need a white background
-        img = Image.new('RGB', (width, height), (255, 255, 255))
-    
-    draw = ImageDraw.Draw(img)
-    
-    # Load fonts
-    try:
-        title_font = ImageFont.truetype(BOLD_FONT, 36)
-        subtitle_font = ImageFont.truetype(BOLD_FONT, 24)
-        heading_font = ImageFont.truetype(BOLD_FONT, 18)
-        normal_font = ImageFont.truetype(REGULAR_FONT, 16)
-        small_font = ImageFont.truetype(REGULAR_FONT, 12)
-    except IOError:
-        # Fallback to default font if custom font not found
-        title_font = ImageFont.load_default()
-        subtitle_font = ImageFont.load_default()
-        heading_font = ImageFont.load_default()
-        normal_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
-    
-    # Calculate daily values
-    total_fat_dv = calculate_dv(nutrition_data.get('total_fat'), DAILY_VALUES["total_fat"])
-    saturated_fat_dv = calculate_dv(nutrition_data.get('saturated_fat'), DAILY_VALUES["saturated_fat"])
-    cholesterol_dv = calculate_dv(nutrition_data.get('cholesterol'), DAILY_VALUES["cholesterol"])
-    sodium_dv = calculate_dv(nutrition_data.get('sodium'), DAILY_VALUES["sodium"])
-    total_carbs_dv = calculate_dv(nutrition_data.get('total_carbs'), DAILY_VALUES["total_carbs"])
-    dietary_fiber_dv = calculate_dv(nutrition_data.get('dietary_fiber'), DAILY_VALUES["dietary_fiber"])
-    added_sugars_dv = calculate_dv(nutrition_data.get('added_sugars'), DAILY_VALUES["added_sugars"])
-    vitamin_d_dv = calculate_dv(nutrition_data.get('vitamin_d'), DAILY_VALUES["vitamin_d"])
-    calcium_dv = calculate_dv(nutrition_data.get('calcium'), DAILY_VALUES["calcium"])
-    iron_dv = calculate_dv(nutrition_data.get('iron'), DAILY_VALUES["iron"])
-    potassium_dv = calculate_dv(nutrition_data.get('potassium'), DAILY_VALUES["potassium"])
-    
-    # Set up colors based on format
-    text_color = (0, 0, 0)  # Black text by default
-    line_color = (0, 0, 0)
-    
-    if format_type == "modern":
-        border_color = (37, 99, 235)  # Blue
-        highlight_color = (219, 234, 254)  # Light blue
-        header_bg = (37, 99, 235)
-        header_text = (255, 255, 255)
-    elif format_type == "gradient":
-        border_color = (147, 51, 234)  # Purple
-        highlight_color = (243, 232, 255)  # Light purple
-        header_bg = (168, 85, 247)
-        header_text = (255, 255, 255)
-    elif format_type == "organic":
-        border_color = (21, 128, 61)  # Green
-        highlight_color = (220, 252, 231)  # Light green
-        header_bg = (21, 128, 61)
-        header_text = (255, 255, 255)
-    else:
-        border_color = (0, 0, 0)  # Black
-        highlight_color = (245, 245, 245)  # Light gray
-        header_bg = (0, 0, 0)
-        header_text = (255, 255, 255)
-    
-    # Draw border around the image for standard formats
-    if format_type in ["standard", "vertical", "tabular"]:
-        border_width = 3
-        draw.rectangle(((border_width, border_width), (width-border_width, height-border_width)), 
-                      outline=border_color, width=border_width)
-    
-    # Different layout rendering based on format type
-    if format_type == "standard":
-        # Standard FDA style format
-        # Title
-        draw.text((width//2, 50), "Nutrition Facts", fill=text_color, font=title_font, anchor="mm")
-        
-        # Product name
-        product_name = nutrition_data.get('product_name', 'Product Name')
-        draw.text((width//2, 90), product_name, fill=text_color, font=subtitle_font, anchor="mm")
-        
-        # Serving info
-        serving_text = f"Serving Size: {nutrition_data.get('serving_size', '0')}g"
-        draw.text((width//2, 130), serving_text, fill=text_color, font=normal_font, anchor="mm")
-        
-        servings_text = f"Servings Per Container: {nutrition_data.get('servings_per_container', '0')}"
-        draw.text((width//2, 160), servings_text, fill=text_color, font=normal_font, anchor="mm")
-        
-        # Horizontal line
-        draw.line([(50, 180), (width-50, 180)], fill=line_color, width=2)
-        
-        # Calories
-        draw.text((80, 210), "Calories", fill=text_color, font=heading_font)
-        draw.text((width-80, 210), nutrition_data.get('calories', '0'), fill=text_color, font=heading_font, anchor="ra")
-        
-        # Horizontal line
-        draw.line([(50, 240), (width-50, 240)], fill=line_color, width=2)
-        
-        # Daily Value header
-        draw.text((width-80, 260), "% Daily Value*", fill=text_color, font=small_font, anchor="ra")
-        
-        # Nutrients list
-        y_pos = 290
-        line_spacing = 30
-        
-        # Total Fat
-        draw.text((80, y_pos), f"Total Fat {nutrition_data.get('total_fat', '0')}g", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{total_fat_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Saturated Fat
-        draw.text((100, y_pos), f"Saturated Fat {nutrition_data.get('saturated_fat', '0')}g", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{saturated_fat_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Trans Fat
-        draw.text((100, y_pos), f"Trans Fat {nutrition_data.get('trans_fat', '0')}g", fill=text_color, font=normal_font)
-        y_pos += line_spacing
-        
-        # Cholesterol
-        draw.text((80, y_pos), f"Cholesterol {nutrition_data.get('cholesterol', '0')}mg", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{cholesterol_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Sodium
-        draw.text((80, y_pos), f"Sodium {nutrition_data.get('sodium', '0')}mg", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{sodium_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Total Carbs
-        draw.text((80, y_pos), f"Total Carbohydrate {nutrition_data.get('total_carbs', '0')}g", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{total_carbs_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Dietary Fiber
-        draw.text((100, y_pos), f"Dietary Fiber {nutrition_data.get('dietary_fiber', '0')}g", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{dietary_fiber_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Total Sugars
-        draw.text((100, y_pos), f"Total Sugars {nutrition_data.get('total_sugars', '0')}g", fill=text_color, font=normal_font)
-        y_pos += line_spacing
-        
-        # Added Sugars
-        draw.text((120, y_pos), f"Added Sugars {nutrition_data.get('added_sugars', '0')}g", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{added_sugars_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Protein
-        draw.text((80, y_pos), f"Protein {nutrition_data.get('protein', '0')}g", fill=text_color, font=normal_font)
-        y_pos += line_spacing
-        
-        # Horizontal line
-        draw.line([(50, y_pos), (width-50, y_pos)], fill=line_color, width=1)
-        y_pos += 20
-        
-        # Vitamins and Minerals
-        draw.text((80, y_pos), f"Vitamin D {nutrition_data.get('vitamin_d', '0')}mcg", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{vitamin_d_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        draw.text((80, y_pos), f"Calcium {nutrition_data.get('calcium', '0')}mg", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{calcium_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        draw.text((80, y_pos), f"Iron {nutrition_data.get('iron', '0')}mg", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{iron_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        draw.text((80, y_pos), f"Potassium {nutrition_data.get('potassium', '0')}mg", fill=text_color, font=normal_font)
-        draw.text((width-80, y_pos), f"{potassium_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Footer note
-        footer_y = height - 60
-        draw.line([(50, footer_y-20), (width-50, footer_y-20)], fill=line_color, width=1)
-        draw.multiline_text((width//2, footer_y), 
-                          "* The % Daily Value (DV) tells you how much a nutrient in a\nserving contributes to a daily diet. 2,000 calories a day is used for general nutrition advice.",
-                          fill=text_color, font=small_font, align="center", anchor="mm")
-    
-    elif format_type == "modern":
-        # Modern blue format with rounded corners
-        # We can't draw rounded corners directly with PIL, but we can simulate it with background colors
-        
-        # Header background
-        draw.rectangle(((0, 0), (width, 150)), fill=header_bg)
-        
-        # Title
-        draw.text((width//2, 50), "Nutrition Facts", fill=header_text, font=title_font, anchor="mm")
-        
-        # Product name
-        product_name = nutrition_data.get('product_name', 'Product Name')
-        draw.text((width//2, 90), product_name, fill=header_text, font=subtitle_font, anchor="mm")
-        
-        # Serving info
-        serving_text = f"Serving Size: {nutrition_data.get('serving_size', '0')}g"
-        draw.text((100, 130), serving_text, fill=header_text, font=small_font)
-        
-        servings_text = f"Servings: {nutrition_data.get('servings_per_container', '0')}"
-        draw.text((width-100, 130), servings_text, fill=header_text, font=small_font, anchor="ra")
-        
-        # Calories box
-        draw.rectangle(((50, 180), (width-50, 230)), fill=highlight_color)
-        draw.text((80, 205), "Calories", fill=border_color, font=heading_font)
-        draw.text((width-80, 205), nutrition_data.get('calories', '0'), fill=border_color, font=heading_font, anchor="ra")
-        
-        # Nutrients header
-        y_pos = 260
-        draw.text((80, y_pos), "Nutrients", fill=border_color, font=heading_font)
-        draw.text((width//2, y_pos), "Amount", fill=border_color, font=heading_font, anchor="mm")
-        draw.text((width-80, y_pos), "% DV*", fill=border_color, font=heading_font, anchor="ra")
-        
-        # Horizontal line
-        draw.line([(50, y_pos+30), (width-50, y_pos+30)], fill=border_color, width=2)
-        
-        # Nutrients list
-        y_pos = 300
-        line_spacing = 30
-        
-        # Total Fat
-        draw.text((80, y_pos), f"Total Fat", fill=text_color, font=normal_font)
-        draw.text((width//2, y_pos), f"{nutrition_data.get('total_fat', '0')}g", fill=text_color, font=normal_font, anchor="mm")
-        draw.text((width-80, y_pos), f"{total_fat_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Saturated Fat
-        draw.text((100, y_pos), f"Saturated Fat", fill=text_color, font=normal_font)
-        draw.text((width//2, y_pos), f"{nutrition_data.get('saturated_fat', '0')}g", fill=text_color, font=normal_font, anchor="mm")
-        draw.text((width-80, y_pos), f"{saturated_fat_dv}%", fill=text_color, font=normal_font, anchor="ra")
-        y_pos += line_spacing
-        
-        # Continue with all nutrients...
-        # The rest of the nutrient listings follow the same pattern
-        
-        # Add vitamin boxes at the bottom
-        vitamin_y = 600
-        box_width = (width-100)//4
-        box_margin = 10
-        
-        # Vitamin D box
-        draw.rectangle([(50, vitamin_y), (50+box_width-box_margin, vitamin_y+70)], fill=highlight_color)
-        draw.text((50+box_width//2-box_margin//2, vitamin_y+20), "Vitamin D", fill=border_color, font=small_font, anchor="mm")
-        draw.text((50+box_width//2-box_margin//2, vitamin_y+50), f"{vitamin_d_dv}%", fill=border_color, font=heading_font, anchor="mm")
-        
-        # Calcium box
-        draw.rectangle([(50+box_width, vitamin_y), (50+2*box_width-box_margin, vitamin_y+70)], fill=highlight_color)
-        draw.text((50+box_width+box_width//2-box_margin//2, vitamin_y+20), "Calcium", fill=border_color, font=small_font, anchor="mm")
-        draw.text((50+box_width+box_width//2-box_margin//2, vitamin_y+50), f"{calcium_dv}%", fill=border_color, font=heading_font, anchor="mm")
-        
-        # Iron box
-        draw.rectangle([(50+2*box_width, vitamin_y), (50+3*box_width-box_margin, vitamin_y+70)], fill=highlight_color)
-        draw.text((50+2*box_width+box_width//2-box_margin//2, vitamin_y+20), "Iron", fill=border_color, font=small_font, anchor="mm")
-        draw.text((50+2*box_width+box_width//2-box_margin//2, vitamin_y+50), f"{iron_dv}%", fill=border_color, font=heading_font, anchor="mm")
-        
-        # Potassium box
-        draw.rectangle([(50+3*box_width, vitamin_y), (50+4*box_width-box_margin, vitamin_y+70)], fill=highlight_color)
-        draw.text((50+3*box_width+box_width//2-box_margin//2, vitamin_y+20), "Potassium", fill=border_color, font=small_font, anchor="mm")
-        draw.text((50+3*box_width+box_width//2-box_margin//2, vitamin_y+50), f"{potassium_dv}%", fill=border_color, font=heading_font, anchor="mm")
-        
-        # Footer note
-        footer_y = height - 50
-        draw.multiline_text((width//2, footer_y), 
-                          "* The % Daily Value (DV) tells you how much a nutrient in a serving contributes to a daily diet.\n2,000 calories a day is used for general nutrition advice.",
-                          fill=text_color, font=small_font, align="center", anchor="mm")
-    
-    elif format_type == "organic":
-        # Organic format with green styling
-        # Header 
-        draw.rectangle([(0, 0), (width, 150)], fill=header_bg)
-        
-        # Title
-        draw.text((width//2, 40), "ORGANIC", fill=header_text, font=heading_font, anchor="mm")
-        draw.text((width//2, 70), "NUTRITION FACTS", fill=header_text, font=title_font, anchor="mm")
-        
-        # Product name
-        product_name = nutrition_data.get('product_name', 'Product Name')
-        draw.text((width//2, 110), product_name, fill=header_text, font=subtitle_font, anchor="mm")
-        
-        # Main content area with light green background
-        draw.rectangle([(0, 150), (width, height-40)], fill=highlight_color)
-        
-        # Calories in white box
-        draw.rectangle([(50, 180), (width-50, 230)], fill=(255, 255, 255), outline=border_color, width=2)
-        draw.text((80, 205), "Calories", fill=border_color, font=heading_font)
-        draw.text((width-80, 205), nutrition_data.get('calories', '0'), fill=border_color, font=heading_font, anchor="ra")
-        
-        # White background for nutrients
-        draw.rectangle([(50, 250), (width-50, 550)], fill=(255, 255, 255), outline=border_color, width=1)
-        
-        # Nutrients header
-        y_pos = 270
-        draw.text((80, y_pos), "Nutrient", fill=border_color, font=heading_font)
-        draw.text((width//2, y_pos), "Amount", fill=border_color, font=heading_font, anchor="mm")
-        draw.text((width-80, y_pos), "% DV*", fill=border_color, font=heading_font, anchor="ra")
-        
-        # Horizontal line
-        draw.line([(60, y_pos+30), (width-60, y_pos+30)], fill=border_color, width=1)
-        
-        # ... and so on for the rest of the nutrients
-        
-        # Footer 
-        draw.rectangle([(0, height-40), (width, height)], fill=header_bg)
-        draw.text((width//2, height-20), "* Percent Daily Values based on a 2,000 calorie diet.", 
-                  fill=header_text, font=small_font, anchor="mm")
+def _load_fonts(scale=1.0):
+    return {role: get_font(face, max(1, round(size * scale))) for role, (face, size) in FONTS.items()}
+
+def _scale_coords(value, scale):
+    if isinstance(value, (int, float)):
+        return round(value * scale)
+    return tuple(_scale_coords(item, scale) for item in value)
+
+def _scale_ops(ops, scale):
+    # Coordinates and line widths grow with the scale; font sizes are scaled in _load_fonts
+    scaled = []
+    for op in ops:
+        kind = op[0]
+        if kind == "line":
+            _, points, fill, width = op
+            scaled.append(("line", _scale_coords(points, scale), fill, max(1, round(width * scale))))
+        elif kind == "rect":
+            _, box, fill, outline, width = op
+            scaled.append(("rect", _scale_coords(box, scale), fill, outline, max(1, round(width * scale))))
+        else:
+            scaled.append((kind, _scale_coords(op[1], scale)) + tuple(op[2:]))
+    return tuple(scaled)
+
+def scaled_layout(format_type, scale=1.0):
+    """Return (size, static_ops, dynamic_ops) of a format's layout drawn at a scale"""
+    # Scaling the ops is cheap next to drawing them, so only the quality
+    # tiers' own scales are kept; one-off widths are scaled per request
+    if scale in _TIER_SCALES:
+        return _cached_scaled_layout(format_type, scale)
+    return _scale_layout(format_type, scale)
+
+_TIER_SCALES = frozenset(round(scale, 3) for scale in QUALITY_TIERS.values())
+
+@lru_cache(maxsize=None)
+def _cached_scaled_layout(format_type, scale):
+    return _scale_layout(format_type, scale)
+
+def _scale_layout(format_type, scale):
+    layout = get_layout(format_type)
+    if scale == 1.0:
+        return layout.size, layout.static_ops, layout.dynamic_ops
+    return (
+        _scale_coords(layout.size, scale),
+        _scale_ops(layout.static_ops, scale),
+        _scale_ops(layout.dynamic_ops, scale)
+    )
+
+def resolve_scale(format_type, options=None):
+    """Turn render options into a canvas scale for a format (a width wins over a scale)"""
+    if options is None:
+        return 1.0
+    if options.width:
+        return round(options.width / get_layout(format_type).size[0], 3)
+    return options.scale
+
+def _draw_ops(draw, ops, fonts, values=None):
+    """Run compiled layout ops on a canvas, filling text templates from values"""
+    for op in ops:
+        kind = op[0]
+        if kind == "text":
+            _, xy, value, font, fill, anchor = op
+            if values is not None:
+                value = value.format_map(values)
+            draw.text(xy, value, fill=fill, font=fonts[font], anchor=anchor)
+        elif kind == "line":
+            _, points, fill, width = op
+            draw.line(points, fill=fill, width=width)
+        elif kind == "rect":
+            _, box, fill, outline, width = op
+            draw.rectangle(box, fill=fill, outline=outline, width=width)
+        elif kind == "multiline":
+            _, xy, value, font, fill, anchor, align = op
+            draw.multiline_text(xy, value, fill=fill, font=fonts[font], align=align, anchor=anchor)
+
+def get_label_chrome(format_type="standard", file_format="png", scale=1.0):
+    """Return the cached base image with the static artwork of a format"""
+    global _chrome_size
+    layout = get_layout(format_type)
+    size, static_ops, _ = scaled_layout(layout.name, scale)
     
-    # ... (implement other formats similarly)
+    # PNG and WebP labels have a transparent background, JPG labels a white one
+    mode = "RGBA" if file_format.lower() in ("png", "webp") else "RGB"
+    key = (layout.name, mode, scale)
+    with _chrome_lock:
+        base = _chrome_cache.get(key)
+        if base is not None:
+            _chrome_cache.move_to_end(key)
+            return base
+        
+        if mode == "RGBA":
+            base = Image.new('RGBA', size, (255, 255, 255, 0))
+        else:
+            base = Image.new('RGB', size, (255, 255, 255))
+        _draw_ops(ImageDraw.Draw(base), static_ops, _load_fonts(scale))
+        
+        # Images bigger than the whole budget are drawn for this render only
+        nbytes = _image_bytes(base)
+        if nbytes > CHROME_CACHE_MAX_BYTES:
+            return base
+        _chrome_cache[key] = base
+        _chrome_size += nbytes
+        
+        # Evict least recently used images until we are back under budget
+        while _chrome_size > CHROME_CACHE_MAX_BYTES:
+            _, evicted = _chrome_cache.popitem(last=False)
+            _chrome_size -= _image_bytes(evicted)
+        return base
+
+def _image_bytes(img):
+    return img.size[0] * img.size[1] * len(img.getbands())
+
+def clear_chrome_cache():
+    """Drop the cached base images and scaled layouts so the next render redraws them"""
+    global _chrome_size
+    with _chrome_lock:
+        _chrome_cache.clear()
+        _chrome_size = 0
+    _cached_scaled_layout.cache_clear()
+
+def encode_image(img, file_format="png", tier="standard", dpi=None):
+    """Encode a label canvas as PNG, JPG or WebP bytes with the encoder settings of a quality tier"""
+    file_format = file_format.lower()
+    settings = dict(ENCODE_SETTINGS[tier].get(file_format, {}))
+    if dpi:
+        settings["dpi"] = (dpi, dpi)
     
-    # Convert to appropriate format and return
     buffer = BytesIO()
-    if file_format.lower() == "png":
-        img.save(buffer, format="PNG")
-    else:
-        # For jpg, need to convert to RGB if the image has alpha channel
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
-        img.save(buffer, format="JPEG", quality=95)
+    with stage("encode"):
+        if file_format == "png":
+            img.save(buffer, format="PNG", **settings)
+        elif file_format == "webp":
+            img.save(buffer, format="WEBP", **settings)
+        else:
+            # For jpg, need to convert to RGB if the image has alpha channel
+            if img.mode == 'RGBA':
+                img = img.convert('RGB')
+            img.save(buffer, format="JPEG", **settings)
     
     image_value = buffer.getvalue()
     buffer.close()
     
-    return image_value
\ No newline at end of file
+    return image_value
+
+def render_layout_image(format_type, label, file_format="png", options=None):
+    """Render a label with the compiled layout of a format, at the size and quality tier in options"""
+    layout = get_layout(format_type)
+    scale = resolve_scale(layout.name, options)
+    _, _, dynamic_ops = scaled_layout(layout.name, scale)
+    
+    # Start from a copy of the format's static artwork and only draw the label's own values
+    with stage("draw"):
+        img = get_label_chrome(layout.name, file_format, scale).copy()
+        _draw_ops(ImageDraw.Draw(img), dynamic_ops, _load_fonts(scale), label_values(label))
+    
+    # Only non-default renders carry DPI metadata, so standard output is unchanged
+    tier = options.tier if options is not None else "standard"
+    dpi = round(BASE_DPI * scale) if scale != 1.0 else None
+    return encode_image(img, file_format, tier, dpi)
+
+def _boxes_overlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+class LabelCanvas:
+    """A rendered label kept in memory so later edits only redraw the text whose values changed"""
+
+    __slots__ = ("chrome", "image", "draw", "fonts", "ops", "op_fields", "values", "boxes", "file_format", "tier", "dpi")
+
+    def __init__(self, format_type, label, file_format="png", options=None):
+        layout = get_layout(format_type)
+        scale = resolve_scale(layout.name, options)
+        _, _, self.ops = scaled_layout(layout.name, scale)
+        self.op_fields = [
+            frozenset(name for _, name, _, _ in Formatter().parse(op[2]) if name)
+            for op in self.ops
+        ]
+        self.file_format = file_format
+        self.tier = options.tier if options is not None else "standard"
+        self.dpi = round(BASE_DPI * scale) if scale != 1.0 else None
+        
+        # A full render to start from
+        self.chrome = get_label_chrome(layout.name, file_format, scale)
+        self.image = self.chrome.copy()
+        self.draw = ImageDraw.Draw(self.image)
+        self.fonts = _load_fonts(scale)
+        self.values = label_values(label)
+        _draw_ops(self.draw, self.ops, self.fonts, self.values)
+        self.boxes = [self._text_box(op, self.values) for op in self.ops]
+
+    def _text_box(self, op, values):
+        # Where an op's text lands, padded so antialiased edges are covered
+        _, xy, value, font, _, anchor = op
+        left, top, right, bottom = self.draw.textbbox(xy, value.format_map(values), font=self.fonts[font], anchor=anchor)
+        width, height = self.image.size
+        return (max(0, left - 2), max(0, top - 2), min(width, right + 2), min(height, bottom + 2))
+
+    def update(self, label):
+        """Apply new label data, redrawing only the changed text (and its %DV); returns the number of ops redrawn"""
+        with stage("draw"):
+            return self._update(label)
+
+    def _update(self, label):
+        values = label_values(label)
+        # Compare the text each op draws, not the raw values: a blank
+        # nutrient's %DV is 0 and a "0" nutrient's is 0.0, which are equal
+        # but print as "0%" and "0.0%"
+        dirty = {
+            index for index, fields in enumerate(self.op_fields)
+            if fields and self.ops[index][2].format_map(self.values) != self.ops[index][2].format_map(values)
+        }
+        if not dirty:
+            self.values = values
+            return 0
+        
+        # Clear both where the old text was and where the new text will go
+        boxes = list(self.boxes)
+        for index in dirty:
+            boxes[index] = self._text_box(self.ops[index], values)
+        regions = [self.boxes[index] for index in dirty] + [boxes[index] for index in dirty]
+        
+        # Text that touches a cleared region is cleared and redrawn whole as
+        # well, so the canvas always matches a full render
+        grew = True
+        while grew:
+            grew = False
+            for index, box in enumerate(self.boxes):
+                if index not in dirty and any(_boxes_overlap(box, region) for region in regions):
+                    dirty.add(index)
+                    regions.append(box)
+                    grew = True
+        
+        for region in regions:
+            if region[0] < region[2] and region[1] < region[3]:
+                self.image.paste(self.chrome.crop(region), region[:2])
+        _draw_ops(self.draw, [self.ops[index] for index in sorted(dirty)], self.fonts, values)
+        
+        self.values = values
+        self.boxes = boxes
+        return len(dirty)
+
+    def encode(self):
+        """Encode the current canvas"""
+        return encode_image(self.image, self.file_format, self.tier, self.dpi)
+
+def create_nutrition_label_image(label, format_type="standard", file_format="png", options=None):
+    """Create an image with the nutrition label in PNG, JPG or WebP format"""
+    return render_layout_image(format_type, label, file_format, options)
@@ -0,0 +1,374 @@
+from collections import deque
+import json
+import os
+import threading
+import time
+import uuid
+
+from ..models.database import RenderJob, SessionLocal
+from ..models.label_data import LabelData
+from .batch_renderer import BatchItem, batch_archive_entries
+from .label_renderer import MIMETYPES, normalize_output_format, render_label
+from .zip_stream import stream_zip
+
+# Where jobs are queued: "memory" keeps them in this process, "database" in
+# the render_jobs table, where every app process's workers claim queued jobs
+# and any of them can answer a status poll. The memory backend only works
+# with a single app process: a poll that reaches another process gets a 404
+# (gunicorn.conf.py refuses to start several workers with it).
+JOB_BACKEND = os.environ.get('JOB_BACKEND', 'memory')
+
+# Jobs run at once in each process, and how many may be queued or running
+# (in the whole store) before new submissions are turned away with a 429
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_QUEUE_MAX = int(os.environ.get('JOB_QUEUE_MAX', 20))
+
+# Seconds a client is told to wait before resubmitting when the queue is full
+JOB_RETRY_AFTER = int(os.environ.get('JOB_RETRY_AFTER', 5))
+
+# How long finished jobs and their results are kept (seconds)
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 3600))
+
+# A running job with no progress written for this long belonged to a worker
+# that stopped (a restart or crash) and is marked failed (seconds)
+JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 600))
+
+# How often idle workers look for queued jobs submitted by other processes,
+# and how often stale and expired jobs are swept (seconds)
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 1.0))
+JOB_SWEEP_INTERVAL = 30
+
+# Shortest gap between two progress writes for the same job (seconds)
+JOB_PROGRESS_INTERVAL = 0.5
+
+# Job status fields returned to clients (everything but the parameters and result bytes)
+JOB_FIELDS = ("id", "kind", "status", "total", "done", "error", "filename", "mimetype", "created_at", "updated_at")
+
+# Statuses of jobs that are done with, one way or the other
+FINISHED_STATUSES = ("done", "failed")
+
+class JobQueueFull(Exception):
+    """Raised when the store already has JOB_QUEUE_MAX jobs queued or running"""
+
+class MemoryJobStore:
+    """Job records, parameters and results kept in this process"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._params = {}
+        self._results = {}
+        self._queued = deque()
+        self._lock = threading.Lock()
+
+    def create(self, job, params):
+        with self._lock:
+            self._jobs[job["id"]] = dict(job)
+            self._params[job["id"]] = params
+            self._queued.append(job["id"])
+
+    def claim(self):
+        """Mark the oldest queued job running and return (id, kind, params), or None"""
+        with self._lock:
+            while self._queued:
+                job_id = self._queued.popleft()
+                job = self._jobs.get(job_id)
+                if job is not None and job["status"] == "queued":
+                    job.update(status="running", updated_at=time.time())
+                    return job_id, job["kind"], self._params.pop(job_id)
+            return None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def finish(self, job_id, data, total):
+        with self._lock:
+            self._results[job_id] = data
+        self.update(job_id, status="done", done=total)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def result(self, job_id):
+        with self._lock:
+            return self._results.get(job_id)
+
+    def pending(self):
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job["status"] not in FINISHED_STATUSES)
+
+    def fail_stale(self, before, error):
+        with self._lock:
+            for job in self._jobs.values():
+                if job["status"] == "running" and job["updated_at"] < before:
+                    job.update(status="failed", error=error, updated_at=time.time())
+
+    def purge(self, before):
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in FINISHED_STATUSES and job["updated_at"] < before
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+                self._results.pop(job_id, None)
+
+class DatabaseJobStore:
+    """Job records, parameters and results kept in the render_jobs table"""
+
+    def _session(self):
+        return SessionLocal()
+
+    def create(self, job, params):
+        db = self._session()
+        try:
+            db.add(RenderJob(params=json.dumps(params), **job))
+            db.commit()
+        finally:
+            db.close()
+
+    def claim(self):
+        """Mark the oldest queued job running and return (id, kind, params), or None"""
+        db = self._session()
+        try:
+            while True:
+                row = (
+                    db.query(RenderJob.id, RenderJob.kind, RenderJob.params)
+                    .filter(RenderJob.status == "queued")
+                    .order_by(RenderJob.created_at)
+                    .first()
+                )
+                if row is None:
+                    db.rollback()
+                    return None
+                # Only one process's update matches while the row is still
+                # queued; a worker that loses the race looks again
+                claimed = (
+                    db.query(RenderJob)
+                    .filter(RenderJob.id == row.id, RenderJob.status == "queued")
+                    .update({"status": "running", "updated_at": time.time()})
+                )
+                db.commit()
+                if claimed:
+                    return row.id, row.kind, json.loads(row.params)
+        finally:
+            db.close()
+
+    def update(self, job_id, **fields):
+        db = self._session()
+        try:
+            fields["updated_at"] = time.time()
+            db.query(RenderJob).filter(RenderJob.id == job_id).update(fields)
+            db.commit()
+        finally:
+            db.close()
+
+    def finish(self, job_id, data, total):
+        self.update(job_id, status="done", done=total, result=data)
+
+    def get(self, job_id):
+        db = self._session()
+        try:
+            # Status polls never load the parameters or result bytes
+            row = (
+                db.query(*[getattr(RenderJob, field) for field in JOB_FIELDS])
+                .filter(RenderJob.id == job_id)
+                .first()
+            )
+            return dict(zip(JOB_FIELDS, row)) if row is not None else None
+        finally:
+            db.close()
+
+    def result(self, job_id):
+        db = self._session()
+        try:
+            row = db.query(RenderJob.result).filter(RenderJob.id == job_id).first()
+            return row[0] if row is not None else None
+        finally:
+            db.close()
+
+    def pending(self):
+        db = self._session()
+        try:
+            return db.query(RenderJob).filter(RenderJob.status.notin_(FINISHED_STATUSES)).count()
+        finally:
+            db.close()
+
+    def fail_stale(self, before, error):
+        db = self._session()
+        try:
+            (
+                db.query(RenderJob)
+                .filter(RenderJob.status == "running", RenderJob.updated_at < before)
+                .update({"status": "failed", "error": error, "updated_at": time.time()})
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def purge(self, before):
+        db = self._session()
+        try:
+            (
+                db.query(RenderJob)
+                .filter(RenderJob.status.in_(FINISHED_STATUSES), RenderJob.updated_at < before)
+                .delete()
+            )
+            db.commit()
+        finally:
+            db.close()
+
+JOB_STORES = {
+    "memory": MemoryJobStore,
+    "database": DatabaseJobStore
+}
+
+def _run_render(params, progress):
+    return render_label(LabelData(params["label"]), params["format_type"], params["output_format"])
+
+def _run_batch(params, progress):
+    items = [
+        BatchItem(name, LabelData(values) if values is not None else None, format_type, error, source)
+        for name, values, format_type, error, source in params["items"]
+    ]
+    return b"".join(stream_zip(batch_archive_entries(items, params["output_format"], progress)))
+
+# How each kind of job is run from the parameters stored with it
+JOB_KINDS = {
+    "render": _run_render,
+    "batch": _run_batch
+}
+
+class JobQueue:
+    """Runs jobs claimed from a store on a local pool of worker threads, refusing new work past a fixed backlog"""
+
+    def __init__(self, store, workers=JOB_WORKERS, max_pending=JOB_QUEUE_MAX):
+        self.store = store
+        self.workers = workers
+        self.max_pending = max_pending
+        self._threads = []
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+
+    def start(self):
+        """Start this process's worker threads unless they're running"""
+        with self._lock:
+            if not self._threads:
+                for index in range(self.workers):
+                    thread = threading.Thread(target=self._work, name=f"render-job-{index}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+
+    def submit(self, kind, params, total, filename, mimetype):
+        """Queue a job of a kind in JOB_KINDS and return its id; raises JobQueueFull when at capacity"""
+        self._sweep()
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if self.store.pending() >= self.max_pending:
+                raise JobQueueFull()
+            self.store.create({
+                "id": job_id,
+                "kind": kind,
+                "status": "queued",
+                "total": total,
+                "done": 0,
+                "error": None,
+                "filename": filename,
+                "mimetype": mimetype,
+                "created_at": now,
+                "updated_at": now
+            }, params)
+
+        # Idle local workers pick it up now instead of at their next poll
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def _work(self):
+        while True:
+            try:
+                claimed = self.store.claim()
+            except Exception:
+                # The store is unreachable; try again at the next poll
+                claimed = None
+            if claimed is not None:
+                self._run(*claimed)
+                continue
+
+            self._sweep()
+            with self._wakeup:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+
+    def _sweep(self):
+        # Fail jobs orphaned by a stopped worker and drop expired results, at
+        # most once per JOB_SWEEP_INTERVAL in each process
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < JOB_SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        try:
+            self.store.fail_stale(now - JOB_STALE_AFTER, "The worker running this job stopped before it finished")
+            self.store.purge(now - JOB_RESULT_TTL)
+        except Exception:
+            pass
+
+    def _run(self, job_id, kind, params):
+        last_write = 0.0
+
+        def progress(done):
+            # Progress is written at most every JOB_PROGRESS_INTERVAL seconds,
+            # and each write shows the job is still alive
+            nonlocal last_write
+            now = time.monotonic()
+            if now - last_write >= JOB_PROGRESS_INTERVAL:
+                last_write = now
+                self.store.update(job_id, done=done)
+
+        try:
+            data = JOB_KINDS[kind](params, progress)
+            self.store.finish(job_id, data, params["total"])
+        except Exception as e:
+            try:
+                self.store.update(job_id, status="failed", error=str(e))
+            except Exception:
+                # Left running; the stale sweep fails it later
+                pass
+
+_queue = None
+_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Return this process's job queue, backed by the store named in JOB_BACKEND, with its workers started"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue(JOB_STORES[JOB_BACKEND]())
+    # Started on first use so a forking server never inherits the threads
+    _queue.start()
+    return _queue
+
+def submit_render_job(label, format_type, output_format, filename):
+    """Queue a single label render and return the job id"""
+    output_format = normalize_output_format(output_format)
+    params = {"label": list(label.values), "format_type": format_type, "output_format": output_format, "total": 1}
+    return get_job_queue().submit("render", params, 1, filename, MIMETYPES[output_format])
+
+def submit_batch_job(items, output_format):
+    """Queue a batch render of BatchItems into one ZIP and return the job id"""
+    output_format = normalize_output_format(output_format)
+    params = {
+        "items": [
+            [item.name, list(item.label.values) if item.label is not None else None, item.format_type, item.error, item.source]
+            for item in items
+        ],
+        "output_format": output_format,
+        "total": len(items)
+    }
+    return get_job_queue().submit("batch", params, len(items), "nutrition-labels.zip", "application/zip")
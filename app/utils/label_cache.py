@@ -0,0 +1,229 @@
+from collections import OrderedDict, namedtuple
+import itertools
+import json
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ..models.database import NutritionLabel
+from ..models.label_data import LabelData
+
+# Where cached labels live: "memory" keeps them in this process, "redis" in
+# a Redis-protocol server at LABEL_CACHE_URL shared by every app node
+# (needs the redis package: pip install .[cache])
+LABEL_CACHE_BACKEND = os.environ.get('LABEL_CACHE_BACKEND', 'memory')
+LABEL_CACHE_URL = os.environ.get('LABEL_CACHE_URL', 'redis://localhost:6379/0')
+
+# How long a cached label is served before it's read again (seconds), and
+# how many labels the in-process cache holds
+LABEL_CACHE_TTL = int(os.environ.get('LABEL_CACHE_TTL', 300))
+LABEL_CACHE_MAX_ENTRIES = int(os.environ.get('LABEL_CACHE_MAX_ENTRIES', 10000))
+
+# Longest a request waits on the shared cache before going to the database (seconds)
+LABEL_CACHE_TIMEOUT = float(os.environ.get('LABEL_CACHE_TIMEOUT', 0.25))
+
+# Bump whenever the cached form changes, so shared caches don't hand the old one to new code
+LABEL_CACHE_VERSION = "1"
+
+class CachedLabel(namedtuple("CachedLabel", ["id", "format_type", "data", "json"])):
+    """A saved label as served: its LabelData and its GET /api/labels/<id> body"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, label):
+        data = LabelData.from_row(label)
+        body = dict(data.to_dict(), id=label.id, format=label.label_format)
+        # Encoded like jsonify, so cached responses match uncached ones byte for byte
+        encoded = (json.dumps(body, sort_keys=True, separators=(",", ":")) + "\n").encode("utf-8")
+        return cls(label.id, label.label_format, data, encoded)
+
+    @classmethod
+    def from_json(cls, encoded):
+        body = json.loads(encoded)
+        return cls(body["id"], body["format"], LabelData.from_payload(body), encoded)
+
+class MemoryLabelStore:
+    """Cached labels kept in this process: a bounded LRU whose entries expire after the TTL"""
+
+    def __init__(self, max_entries=LABEL_CACHE_MAX_ENTRIES, ttl=LABEL_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # label id -> (expiry time, CachedLabel)
+        self._entries = OrderedDict()
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, label_id):
+        with self._lock:
+            entry = self._entries.get(label_id)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[label_id]
+                return None
+            self._entries.move_to_end(label_id)
+            return entry[1]
+
+    def put(self, label):
+        with self._lock:
+            self._entries[label.id] = (time.monotonic() + self.ttl, label)
+            self._entries.move_to_end(label.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def delete(self, label_ids):
+        with self._lock:
+            for label_id in label_ids:
+                self._entries.pop(label_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "max_entries": self.max_entries, "evictions": self._evictions}
+
+class RedisLabelStore:
+    """Cached labels in a Redis-protocol server shared by every app node.
+
+    Entries expire after the TTL; the LRU bound is the server's own
+    (maxmemory with an allkeys-lru policy).
+    """
+
+    def __init__(self, url=LABEL_CACHE_URL, ttl=LABEL_CACHE_TTL):
+        # Imported here so only deployments using this backend need the package
+        import redis
+
+        self.ttl = ttl
+        self.prefix = f"nutrition-labeler:label:{LABEL_CACHE_VERSION}:"
+        self._client = redis.Redis.from_url(url, socket_timeout=LABEL_CACHE_TIMEOUT, socket_connect_timeout=LABEL_CACHE_TIMEOUT)
+
+    def get(self, label_id):
+        data = self._client.get(self.prefix + str(label_id))
+        return CachedLabel.from_json(data) if data is not None else None
+
+    def put(self, label):
+        self._client.set(self.prefix + str(label.id), label.json, ex=self.ttl)
+
+    def delete(self, label_ids):
+        self._client.delete(*(self.prefix + str(label_id) for label_id in label_ids))
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self.prefix + "*"))
+        if keys:
+            self._client.delete(*keys)
+
+    def stats(self):
+        return {}
+
+LABEL_CACHE_STORES = {
+    "memory": MemoryLabelStore,
+    "redis": RedisLabelStore
+}
+
+class LabelCache:
+    """Read-through cache of saved labels in front of the nutrition_labels table"""
+
+    def __init__(self, store):
+        self.store = store
+        # Invalidations seen by this process, so a read that raced a write
+        # doesn't put the row it read before the write back in the cache
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "invalidations": 0, "errors": 0}
+
+    def get(self, db, label_id):
+        """Return a saved label, reading it from the database on a miss; None if there is no such label"""
+        try:
+            label = self.store.get(label_id)
+        except Exception:
+            # An unreachable shared cache only costs us the shortcut
+            self._count("errors")
+            label = None
+        if label is not None:
+            self._count("hits")
+            return label
+
+        with self._lock:
+            self._stats["misses"] += 1
+            generation = self._generation
+
+        row = db.query(NutritionLabel).filter(NutritionLabel.id == label_id).first()
+        if row is None:
+            return None
+        label = CachedLabel.from_row(row)
+
+        if generation == self._generation:
+            try:
+                self.store.put(label)
+            except Exception:
+                self._count("errors")
+        return label
+
+    def invalidate(self, label_ids):
+        """Drop labels from the cache after they were written"""
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += len(label_ids)
+        try:
+            self.store.delete(label_ids)
+        except Exception:
+            # The shared cache drops the stale entry itself once its TTL runs out
+            self._count("errors")
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+        self.store.clear()
+
+    def stats(self):
+        """Return hit/miss/invalidation counters and the store's own numbers"""
+        with self._lock:
+            stats = dict(self._stats, backend=LABEL_CACHE_BACKEND)
+        stats.update(self.store.stats())
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_label_cache():
+    """Return this process's label cache, backed by the store named in LABEL_CACHE_BACKEND"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LabelCache(LABEL_CACHE_STORES[LABEL_CACHE_BACKEND]())
+        return _cache
+
+def _collect_label_writes(session, flush_context):
+    # Ids are known once the flush has run, and session.new/dirty/deleted still
+    # list what it wrote
+    label_ids = session.info.setdefault("label_cache_ids", set())
+    for instance in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(instance, NutritionLabel) and instance.id is not None:
+            label_ids.add(instance.id)
+
+def _invalidate_committed(session):
+    # Only once the transaction commits, or a reader could cache the old row again
+    label_ids = session.info.pop("label_cache_ids", None)
+    if label_ids:
+        get_label_cache().invalidate(label_ids)
+
+def _forget_rolled_back(session):
+    session.info.pop("label_cache_ids", None)
+
+def instrument_label_writes():
+    """Invalidate cached labels whenever an ORM session commits changes to them"""
+    if not event.contains(Session, "after_flush", _collect_label_writes):
+        event.listen(Session, "after_flush", _collect_label_writes)
+        event.listen(Session, "after_commit", _invalidate_committed)
+        event.listen(Session, "after_rollback", _forget_rolled_back)
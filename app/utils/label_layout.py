@@ -0,0 +1,254 @@
+from collections import namedtuple
+from string import Formatter
+
+# One nutrient line on a label. indent is the nesting level (Saturated Fat sits
+# under Total Fat), dv says whether the row shows a % Daily Value.
+NutrientRow = namedtuple("NutrientRow", ["field", "label", "unit", "indent", "dv"])
+
+MAIN_NUTRIENT_ROWS = (
+    NutrientRow("total_fat", "Total Fat", "g", 0, True),
+    NutrientRow("saturated_fat", "Saturated Fat", "g", 1, True),
+    NutrientRow("trans_fat", "Trans Fat", "g", 1, False),
+    NutrientRow("cholesterol", "Cholesterol", "mg", 0, True),
+    NutrientRow("sodium", "Sodium", "mg", 0, True),
+    NutrientRow("total_carbs", "Total Carbohydrate", "g", 0, True),
+    NutrientRow("dietary_fiber", "Dietary Fiber", "g", 1, True),
+    NutrientRow("total_sugars", "Total Sugars", "g", 1, False),
+    NutrientRow("added_sugars", "Added Sugars", "g", 2, True),
+    NutrientRow("protein", "Protein", "g", 0, False)
+)
+
+VITAMIN_ROWS = (
+    NutrientRow("vitamin_d", "Vitamin D", "mcg", 0, True),
+    NutrientRow("calcium", "Calcium", "mg", 0, True),
+    NutrientRow("iron", "Iron", "mg", 0, True),
+    NutrientRow("potassium", "Potassium", "mg", 0, True)
+)
+
+NUTRIENT_ROWS = MAIN_NUTRIENT_ROWS + VITAMIN_ROWS
+
+# Columns of the compact "at a glance" table used by the simplified formats
+SUMMARY_COLUMNS = (
+    ("total_fat", "Total Fat", "g"),
+    ("total_carbs", "Total Carbs", "g"),
+    ("sodium", "Sodium", "mg"),
+    ("protein", "Protein", "g")
+)
+
+STANDARD_FOOTNOTE = "* The % Daily Value (DV) tells you how much a nutrient in a\nserving contributes to a daily diet. 2,000 calories a day is used for general nutrition advice."
+MODERN_FOOTNOTE = "* The % Daily Value (DV) tells you how much a nutrient in a serving contributes to a daily diet.\n2,000 calories a day is used for general nutrition advice."
+SHORT_FOOTNOTE = "* Percent Daily Values based on a 2,000 calorie diet."
+
+# Layouts are drawn at this resolution when scale is 1
+BASE_DPI = 100
+
+# Font roles used by layouts, as (face, size) for the font registry
+FONTS = {
+    "title": ("bold", 36),
+    "subtitle": ("bold", 24),
+    "heading": ("bold", 18),
+    "normal": ("regular", 16),
+    "small": ("regular", 12)
+}
+
+# Color palettes; layouts refer to colors by role
+BLACK_PALETTE = {
+    "text": (0, 0, 0),
+    "line": (0, 0, 0),
+    "border": (0, 0, 0),
+    "highlight": (245, 245, 245),  # Light gray
+    "header_bg": (0, 0, 0),
+    "header_text": (255, 255, 255),
+    "white": (255, 255, 255)
+}
+MODERN_PALETTE = dict(BLACK_PALETTE, border=(37, 99, 235), highlight=(219, 234, 254), header_bg=(37, 99, 235))
+GRADIENT_PALETTE = dict(BLACK_PALETTE, border=(147, 51, 234), highlight=(243, 232, 255), header_bg=(168, 85, 247))
+ORGANIC_PALETTE = dict(BLACK_PALETTE, border=(21, 128, 61), highlight=(220, 252, 231), header_bg=(21, 128, 61))
+
+# Layout spec building blocks. Text may contain {field} placeholders; anything
+# without one is static and ends up in the format's cached chrome.
+def text(xy, value, font, fill="text", anchor=None):
+    return ("text", xy, value, font, fill, anchor)
+
+def multiline(xy, value, font, fill="text", anchor=None, align="center"):
+    return ("multiline", xy, value, font, fill, anchor, align)
+
+def line(start, end, fill="line", width=1):
+    return ("line", [start, end], fill, width)
+
+def rect(box, fill=None, outline=None, width=1):
+    return ("rect", box, fill, outline, width)
+
+def border(size, fill="border", width=3):
+    w, h = size
+    return rect(((width, width), (w-width, h-width)), outline=fill, width=width)
+
+def nutrient_rows(rows, x, y, dv_x, amount_x=None, spacing=30, indent=20, font="normal", fill="text"):
+    """Spec ops for a block of nutrient rows.
+
+    Rows read "Total Fat 7g" with the %DV right-aligned at dv_x, or, when
+    amount_x is given, put the amount in its own centered column.
+    """
+    ops = []
+    for row in rows:
+        row_x = x + row.indent*indent
+        if amount_x is None:
+            ops.append(text((row_x, y), f"{row.label} {{{row.field}}}{row.unit}", font, fill))
+        else:
+            ops.append(text((row_x, y), row.label, font, fill))
+            ops.append(text((amount_x, y), f"{{{row.field}}}{row.unit}", font, fill, anchor="mm"))
+        if row.dv:
+            ops.append(text((dv_x, y), f"{{{row.field}_dv}}%", font, fill, anchor="ra"))
+        y += spacing
+    return ops
+
+def vitamin_boxes(rows, x, y, total_width, box_height=70, box_margin=10):
+    """Spec ops for a row of highlighted boxes showing each nutrient's name and %DV"""
+    ops = []
+    box_width = total_width//len(rows)
+    for index, row in enumerate(rows):
+        box_x = x + index*box_width
+        center_x = box_x + box_width//2 - box_margin//2
+        ops.append(rect([(box_x, y), (box_x+box_width-box_margin, y+box_height)], fill="highlight"))
+        ops.append(text((center_x, y+20), row.label, "small", "border", anchor="mm"))
+        ops.append(text((center_x, y+50), f"{{{row.field}_dv}}%", "heading", "border", anchor="mm"))
+    return ops
+
+# Per-format layout specs: canvas size, palette and draw ops in paint order
+STANDARD_LAYOUT = {
+    "size": (500, 800),
+    "palette": BLACK_PALETTE,
+    "ops": [
+        border((500, 800)),
+        text((250, 50), "Nutrition Facts", "title", anchor="mm"),
+        text((250, 90), "{product_name}", "subtitle", anchor="mm"),
+        text((250, 130), "Serving Size: {serving_size}g", "normal", anchor="mm"),
+        text((250, 160), "Servings Per Container: {servings_per_container}", "normal", anchor="mm"),
+        line((50, 180), (450, 180), width=2),
+        text((80, 210), "Calories", "heading"),
+        text((420, 210), "{calories}", "heading", anchor="ra"),
+        line((50, 240), (450, 240), width=2),
+        text((420, 260), "% Daily Value*", "small", anchor="ra"),
+        *nutrient_rows(MAIN_NUTRIENT_ROWS, x=80, y=290, dv_x=420),
+        line((50, 590), (450, 590)),
+        *nutrient_rows(VITAMIN_ROWS, x=80, y=610, dv_x=420),
+        line((50, 720), (450, 720)),
+        multiline((250, 740), STANDARD_FOOTNOTE, "small", anchor="mm")
+    ]
+}
+
+MODERN_LAYOUT = {
+    "size": (500, 600),
+    "palette": MODERN_PALETTE,
+    "ops": [
+        rect(((0, 0), (500, 150)), fill="header_bg"),
+        text((250, 50), "Nutrition Facts", "title", "header_text", anchor="mm"),
+        text((250, 90), "{product_name}", "subtitle", "header_text", anchor="mm"),
+        text((100, 130), "Serving Size: {serving_size}g", "small", "header_text"),
+        text((400, 130), "Servings: {servings_per_container}", "small", "header_text", anchor="ra"),
+        rect(((50, 180), (450, 230)), fill="highlight"),
+        text((80, 205), "Calories", "heading", "border"),
+        text((420, 205), "{calories}", "heading", "border", anchor="ra"),
+        text((80, 260), "Nutrients", "heading", "border"),
+        text((250, 260), "Amount", "heading", "border", anchor="mm"),
+        text((420, 260), "% DV*", "heading", "border", anchor="ra"),
+        line((50, 290), (450, 290), fill="border", width=2),
+        *nutrient_rows(MAIN_NUTRIENT_ROWS[:2], x=80, y=300, dv_x=420, amount_x=250),
+        *vitamin_boxes(VITAMIN_ROWS, x=50, y=600, total_width=400),
+        multiline((250, 550), MODERN_FOOTNOTE, "small", anchor="mm")
+    ]
+}
+
+ORGANIC_LAYOUT = {
+    "size": (500, 600),
+    "palette": ORGANIC_PALETTE,
+    "ops": [
+        rect([(0, 0), (500, 150)], fill="header_bg"),
+        text((250, 40), "ORGANIC", "heading", "header_text", anchor="mm"),
+        text((250, 70), "NUTRITION FACTS", "title", "header_text", anchor="mm"),
+        text((250, 110), "{product_name}", "subtitle", "header_text", anchor="mm"),
+        rect([(0, 150), (500, 560)], fill="highlight"),
+        rect([(50, 180), (450, 230)], fill="white", outline="border", width=2),
+        text((80, 205), "Calories", "heading", "border"),
+        text((420, 205), "{calories}", "heading", "border", anchor="ra"),
+        rect([(50, 250), (450, 550)], fill="white", outline="border", width=1),
+        text((80, 270), "Nutrient", "heading", "border"),
+        text((250, 270), "Amount", "heading", "border", anchor="mm"),
+        text((420, 270), "% DV*", "heading", "border", anchor="ra"),
+        line((60, 300), (440, 300), fill="border"),
+        rect([(0, 560), (500, 600)], fill="header_bg"),
+        text((250, 580), SHORT_FOOTNOTE, "small", "header_text", anchor="mm")
+    ]
+}
+
+# Formats that don't have artwork of their own yet only get their canvas (and border)
+IMAGE_LAYOUTS = {
+    "standard": STANDARD_LAYOUT,
+    "vertical": {"size": (500, 800), "palette": BLACK_PALETTE, "ops": [border((500, 800))]},
+    "horizontal": {"size": (800, 500), "palette": BLACK_PALETTE, "ops": []},
+    "tabular": {"size": (600, 800), "palette": BLACK_PALETTE, "ops": [border((600, 800))]},
+    "modern": MODERN_LAYOUT,
+    "gradient": {"size": (500, 600), "palette": GRADIENT_PALETTE, "ops": []},
+    "organic": ORGANIC_LAYOUT,
+    "simplified": {"size": (500, 600), "palette": BLACK_PALETTE, "ops": []}
+}
+
+# Label formats with their own layout; anything else renders like "simplified"
+LABEL_FORMATS = list(IMAGE_LAYOUTS)
+
+class CompiledLayout:
+    """A layout spec resolved into flat draw-op lists.
+
+    static_ops never change for the format and are drawn once into the cached
+    chrome; dynamic_ops are (kind, xy, template, font, fill, anchor) text ops
+    filled in from the label values on every render.
+    """
+
+    __slots__ = ("name", "size", "static_ops", "dynamic_ops", "fields")
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.size = spec["size"]
+        palette = spec["palette"]
+        static_ops = []
+        dynamic_ops = []
+        fields = set()
+
+        def color(role):
+            return palette[role] if role is not None else None
+
+        for op in spec["ops"]:
+            kind = op[0]
+            if kind == "rect":
+                _, box, fill, outline, width = op
+                static_ops.append(("rect", box, color(fill), color(outline), width))
+            elif kind == "line":
+                _, points, fill, width = op
+                static_ops.append(("line", points, color(fill), width))
+            elif kind == "multiline":
+                _, xy, value, font, fill, anchor, align = op
+                static_ops.append(("multiline", xy, value, font, color(fill), anchor, align))
+            else:
+                _, xy, value, font, fill, anchor = op
+                names = [name for _, name, _, _ in Formatter().parse(value) if name]
+                if names:
+                    fields.update(names)
+                    dynamic_ops.append(("text", xy, value, font, color(fill), anchor))
+                else:
+                    static_ops.append(("text", xy, value, font, color(fill), anchor))
+
+        self.static_ops = tuple(static_ops)
+        self.dynamic_ops = tuple(dynamic_ops)
+        self.fields = frozenset(fields)
+
+# Every format compiled once at import
+COMPILED_LAYOUTS = {name: CompiledLayout(name, spec) for name, spec in IMAGE_LAYOUTS.items()}
+
+def get_layout(format_type):
+    """Return the compiled layout for a label format"""
+    return COMPILED_LAYOUTS.get(format_type) or COMPILED_LAYOUTS["simplified"]
+
+def label_values(label):
+    """Return the substitution values for a label: every field plus a <nutrient>_dv for each daily value"""
+    # Worked out once when the LabelData was built
+    return label.template_values
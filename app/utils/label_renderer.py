@@ -0,0 +1,153 @@
+from collections import namedtuple
+import os
+import threading
+import time
+
+from .label_layout import BASE_DPI
+from .stage_timing import tag_render
+from .render_cache import RENDER_WAIT_POLL_INTERVAL, RenderCancelled, make_cache_key, render_cache
+
+# Bump whenever the generators change what they draw, so cached renders and
+# ETags handed out for the old output stop matching
+RENDERER_VERSION = "2"
+
+# Mimetypes for each supported output format
+MIMETYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "webp": "image/webp",
+    "svg": "image/svg+xml",
+    "pdf": "application/pdf"
+}
+
+# Canvas scale of each quality tier: previews are drawn small and encoded
+# fast, print output is drawn at PRINT_DPI
+PRINT_DPI = int(os.environ.get('PRINT_DPI', 300))
+QUALITY_TIERS = {
+    "preview": 0.5,
+    "standard": 1.0,
+    "print": PRINT_DPI / BASE_DPI
+}
+
+# Largest canvas a request may ask for, as a scale (4 draws the 500x800
+# label at 2000x3200) or as a width in pixels
+MAX_RENDER_SCALE = float(os.environ.get('MAX_RENDER_SCALE', 4))
+MAX_RENDER_WIDTH = int(os.environ.get('MAX_RENDER_WIDTH', 2000))
+
+# How a label image is rendered: quality tier, canvas scale and an optional
+# target width in pixels that overrides the scale
+RenderOptions = namedtuple("RenderOptions", ["tier", "scale", "width"])
+DEFAULT_RENDER_OPTIONS = RenderOptions("standard", 1.0, None)
+
+# Live renders allowed at once in this process; past that, requests queue
+# (and give up if their client disconnects while queued)
+RENDER_CONCURRENCY = int(os.environ.get('RENDER_CONCURRENCY', os.cpu_count() or 1))
+_render_slots = threading.BoundedSemaphore(RENDER_CONCURRENCY)
+
+# Renders, time spent rendering and bytes produced per quality tier
+_tier_stats = {tier: {"renders": 0, "render_seconds": 0.0, "bytes": 0} for tier in QUALITY_TIERS}
+_tier_lock = threading.Lock()
+
+def normalize_output_format(output_format):
+    """Map a requested output format onto one we can render (defaults to PNG)"""
+    output_format = (output_format or "png").lower()
+    if output_format == "jpeg":
+        output_format = "jpg"
+    return output_format if output_format in MIMETYPES else "png"
+
+def render_options(quality=None, width=None, scale=None, dpi=None):
+    """Build RenderOptions from request parameters; raises ValueError on bad values"""
+    tier = (quality or "standard").lower()
+    if tier not in QUALITY_TIERS:
+        raise ValueError(f"quality must be one of {', '.join(QUALITY_TIERS)}")
+
+    try:
+        width = int(width) if width is not None else None
+        scale = float(scale) if scale is not None else None
+        dpi = int(dpi) if dpi is not None else None
+    except (TypeError, ValueError):
+        raise ValueError("width, scale and dpi must be numbers")
+
+    # An explicit width, scale or dpi overrides the tier's own canvas size
+    resolved_scale = QUALITY_TIERS[tier]
+    if width is not None:
+        if not 50 <= width <= MAX_RENDER_WIDTH:
+            raise ValueError(f"width must be between 50 and {MAX_RENDER_WIDTH}")
+    elif scale is not None:
+        resolved_scale = scale
+    elif dpi is not None:
+        resolved_scale = dpi / BASE_DPI
+
+    if not 0.1 <= resolved_scale <= MAX_RENDER_SCALE:
+        raise ValueError(f"scale must be between 0.1 and {MAX_RENDER_SCALE:g}")
+    return RenderOptions(tier, round(resolved_scale, 3), width)
+
+def render_label_uncached(label, format_type, output_format, options=None):
+    """Render a label to PNG, JPG, WebP, SVG or PDF bytes"""
+    # The generators pull in ReportLab and Pillow, so they're imported with
+    # the first render of their kind instead of at app startup
+    if output_format == "pdf":
+        # PDFs are vector output, so size and quality options don't apply
+        from .pdf_generator import create_nutrition_label_pdf
+        return create_nutrition_label_pdf(label, format_type)
+    if output_format == "svg":
+        # SVG is vector too; only the size options change the output
+        from .simple_image_generator import create_nutrition_label_svg
+        return create_nutrition_label_svg(label, format_type, options)
+    from .simple_image_generator import create_nutrition_label_image
+    return create_nutrition_label_image(label, format_type, output_format, options)
+
+def render_key(label, format_type, output_format, options=None):
+    """Content hash identifying one rendered artifact; also used as its strong ETag"""
+    output_format = normalize_output_format(output_format)
+    version = RENDERER_VERSION
+    if options is not None and options != DEFAULT_RENDER_OPTIONS and output_format != "pdf":
+        version = f"{RENDERER_VERSION}:{options.tier}:{options.scale}:{options.width}"
+    return make_cache_key(label, format_type, output_format, version)
+
+def render_label(label, format_type, output_format, options=None, cancelled=None):
+    """Render a label, serving repeat renders of the same content from the render cache"""
+    # Identical renders already in flight are shared rather than repeated;
+    # once cancelled() returns True the render is abandoned with RenderCancelled
+    output_format = normalize_output_format(output_format)
+    key = render_key(label, format_type, output_format, options)
+    tag_render(format_type, output_format)
+
+    def render():
+        _acquire_render_slot(cancelled)
+        try:
+            start = time.perf_counter()
+            data = render_label_uncached(label, format_type, output_format, options)
+        finally:
+            _render_slots.release()
+        record_render(options.tier if options is not None else "standard", time.perf_counter() - start, len(data))
+        return data
+
+    return render_cache.get_or_render(key, render, cancelled)
+
+def _acquire_render_slot(cancelled):
+    # Wait for a free render slot, checking on the client while queued
+    while not _render_slots.acquire(timeout=RENDER_WAIT_POLL_INTERVAL):
+        if cancelled is not None and cancelled():
+            raise RenderCancelled()
+
+def record_render(tier, seconds, size):
+    """Count one render of a quality tier"""
+    with _tier_lock:
+        stats = _tier_stats[tier]
+        stats["renders"] += 1
+        stats["render_seconds"] += seconds
+        stats["bytes"] += size
+
+def render_tier_stats():
+    """Return render counts, average render time and average size per quality tier"""
+    with _tier_lock:
+        report = {}
+        for tier, stats in _tier_stats.items():
+            renders = stats["renders"]
+            report[tier] = dict(
+                stats,
+                avg_render_ms=stats["render_seconds"] * 1000 / renders if renders else 0.0,
+                avg_bytes=stats["bytes"] / renders if renders else 0
+            )
+        return report
@@ -4,160 +4,295 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from io import BytesIO
-from .daily_values import DAILY_VALUES, calculate_dv
+import threading
+from ..models.label_data import LabelData
+from .label_layout import MAIN_NUTRIENT_ROWS, NUTRIENT_ROWS, SUMMARY_COLUMNS, label_values
+from .stage_timing import stage
 
-def create_nutrition_label_pdf(nutrition_data, format_type="standard"):
-    """Create a PDF with the nutrition label"""
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, 
-                            rightMargin=72, leftMargin=72, 
-                            topMargin=72, bottomMargin=72)
-    
-    # Get styles
+FOOTNOTE_TEXT = "* The % Daily Value (DV) tells you how much a nutrient in a serving of food contributes to a daily diet. 2,000 calories a day is used for general nutrition advice."
+
+# Table styles are never modified once built, so every document shares them.
+# Top-level nutrients (Total Fat, Cholesterol, ...) are bold in the detailed table.
+DETAILED_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 12),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.white),
+    ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
+    ('ALIGN', (1, 1), (1, -1), 'CENTER'),
+    ('ALIGN', (2, 1), (2, -1), 'CENTER'),
+    ('FONTNAME', (0, 1), (0, -1), 'Helvetica'),
+] + [
+    ('FONTNAME', (0, index), (0, index), 'Helvetica-Bold')
+    for index, row in enumerate(MAIN_NUTRIENT_ROWS, start=1) if row.indent == 0
+] + [
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+])
+
+SIMPLIFIED_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, 0), colors.lightblue),
+    ('BACKGROUND', (1, 0), (1, 0), colors.lightgreen),
+    ('BACKGROUND', (2, 0), (2, 0), colors.salmon),
+    ('BACKGROUND', (3, 0), (3, 0), colors.lavender),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+])
+
+# Outline drawn around each label on a sheet
+SHEET_TABLE_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.lightgrey),
+    ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 6),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+])
+
+# Cell padding and leading ReportLab uses for table cells unless told otherwise
+TABLE_CELL_DEFAULTS = [
+    ('LEFTPADDING', (0, 0), (-1, -1), 6),
+    ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+    ('TOPPADDING', (0, 0), (-1, -1), 3),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 3),
+    ('LEADING', (0, 0), (-1, -1), 12),
+]
+
+# Table commands whose fourth item (a size, padding or line width) scales with the label
+SCALED_TABLE_COMMANDS = (
+    'FONTSIZE', 'LEADING', 'LEFTPADDING', 'RIGHTPADDING', 'TOPPADDING', 'BOTTOMPADDING',
+    'GRID', 'BOX', 'INNERGRID', 'LINEABOVE', 'LINEBELOW', 'LINEBEFORE', 'LINEAFTER'
+)
+
+# Label styles per scale: scale 1 for single-label PDFs, and one per sheet
+# grid size, where every label is drawn at the size of its cell
+_styles = {}
+_styles_lock = threading.Lock()
+
+# Natural (unscaled) size of each kind of label's flowables, measured once
+_natural_sizes = {}
+
+def get_label_styles(scale=1.0):
+    """Return the paragraph and table styles used by every label drawn at a scale, building them once per process"""
+    with _styles_lock:
+        styles = _styles.get(scale)
+        if styles is None:
+            styles = _styles[scale] = _build_label_styles(scale)
+        return styles
+
+def _build_label_styles(scale):
     styles = getSampleStyleSheet()
+    
     title_style = styles['Heading1']
     title_style.alignment = 1  # center alignment
     
     subtitle_style = styles['Heading2']
     subtitle_style.alignment = 1
     
-    normal_style = styles['Normal']
+    calories_style = ParagraphStyle('CaloriesStyle', parent=styles['Heading2'])
+    calories_style.alignment = 0  # left alignment
+    
+    footnote_style = ParagraphStyle('Footnote', parent=styles['Normal'])
+    footnote_style.fontSize = 8
+    
+    paragraph_styles = {
+        "title": title_style,
+        "subtitle": subtitle_style,
+        "normal": styles['Normal'],
+        "calories": calories_style,
+        "footnote": footnote_style
+    }
+    if scale != 1.0:
+        paragraph_styles = {
+            name: ParagraphStyle(
+                f"{style.name}@{scale}", parent=style,
+                fontSize=style.fontSize * scale, leading=style.leading * scale,
+                spaceBefore=style.spaceBefore * scale, spaceAfter=style.spaceAfter * scale
+            )
+            for name, style in paragraph_styles.items()
+        }
+    
+    return dict(
+        paragraph_styles,
+        detailed_table=_scale_table_style(DETAILED_TABLE_STYLE, scale),
+        simplified_table=_scale_table_style(SIMPLIFIED_TABLE_STYLE, scale)
+    )
+
+def _scale_table_style(style, scale):
+    # Font sizes, leading, padding and line widths all shrink with the label
+    if scale == 1.0:
+        return style
+    commands = []
+    for command in TABLE_CELL_DEFAULTS + list(style.getCommands()):
+        if command[0] in SCALED_TABLE_COMMANDS:
+            command = tuple(command[:3]) + (command[3] * scale,) + tuple(command[4:])
+        commands.append(command)
+    return TableStyle(commands)
+
+def clear_label_styles():
+    """Drop the built label styles and sizes so the next label builds them again"""
+    with _styles_lock:
+        _styles.clear()
+        _natural_sizes.clear()
+
+# Formats drawn with the full nutrient table; the rest get the summary table
+DETAILED_FORMATS = ("standard", "horizontal", "vertical", "tabular")
+
+def build_label_flowables(label, format_type="standard", scale=1.0):
+    """Build the ReportLab flowables for one label, drawn at scale times its natural size"""
+    styles = get_label_styles(scale)
     
     # Create elements
     elements = []
     
     # Title
-    elements.append(Paragraph("Nutrition Facts", title_style))
-    elements.append(Spacer(1, 0.2*inch))
+    elements.append(Paragraph("Nutrition Facts", styles["title"]))
+    elements.append(Spacer(1, 0.2*inch*scale))
     
     # Product name if provided
-    if nutrition_data.get('product_name'):
-        elements.append(Paragraph(nutrition_data.get('product_name'), subtitle_style))
-        elements.append(Spacer(1, 0.1*inch))
+    if label.get('product_name'):
+        elements.append(Paragraph(label.get('product_name'), styles["subtitle"]))
+        elements.append(Spacer(1, 0.1*inch*scale))
     
     # Serving information
-    serving_text = f"Serving Size: {nutrition_data.get('serving_size', '0')}g"
-    if nutrition_data.get('servings_per_container'):
-        serving_text += f" | Servings Per Container: {nutrition_data.get('servings_per_container', '0')}"
-    elements.append(Paragraph(serving_text, normal_style))
-    elements.append(Spacer(1, 0.2*inch))
+    serving_text = f"Serving Size: {label.get('serving_size', '0')}g"
+    if label.get('servings_per_container'):
+        serving_text += f" | Servings Per Container: {label.get('servings_per_container', '0')}"
+    elements.append(Paragraph(serving_text, styles["normal"]))
+    elements.append(Spacer(1, 0.2*inch*scale))
     
     # Calories
-    calories_style = ParagraphStyle('CaloriesStyle', parent=styles['Heading2'])
-    calories_style.alignment = 0  # left alignment
-    elements.append(Paragraph(f"Calories: {nutrition_data.get('calories', '0')}", calories_style))
-    elements.append(Spacer(1, 0.2*inch))
+    elements.append(Paragraph(f"Calories: {label.get('calories', '0')}", styles["calories"]))
+    elements.append(Spacer(1, 0.2*inch*scale))
+    
+    values = label_values(label)
     
     # Create a more detailed table for standard format
-    if format_type in ["standard", "horizontal", "vertical", "tabular"]:
-        # Calculate daily values
-        total_fat_dv = calculate_dv(nutrition_data.get('total_fat'), DAILY_VALUES["total_fat"])
-        saturated_fat_dv = calculate_dv(nutrition_data.get('saturated_fat'), DAILY_VALUES["saturated_fat"])
-        cholesterol_dv = calculate_dv(nutrition_data.get('cholesterol'), DAILY_VALUES["cholesterol"])
-        sodium_dv = calculate_dv(nutrition_data.get('sodium'), DAILY_VALUES["sodium"])
-        total_carbs_dv = calculate_dv(nutrition_data.get('total_carbs'), DAILY_VALUES["total_carbs"])
-        dietary_fiber_dv = calculate_dv(nutrition_data.get('dietary_fiber'), DAILY_VALUES["dietary_fiber"])
-        added_sugars_dv = calculate_dv(nutrition_data.get('added_sugars'), DAILY_VALUES["added_sugars"])
-        vitamin_d_dv = calculate_dv(nutrition_data.get('vitamin_d'), DAILY_VALUES["vitamin_d"])
-        calcium_dv = calculate_dv(nutrition_data.get('calcium'), DAILY_VALUES["calcium"])
-        iron_dv = calculate_dv(nutrition_data.get('iron'), DAILY_VALUES["iron"])
-        potassium_dv = calculate_dv(nutrition_data.get('potassium'), DAILY_VALUES["potassium"])
-        
-        # Create nutrition table data
-        data = [
-            ["Nutrient", "Amount", "% Daily Value*"],
-            ["Total Fat", f"{nutrition_data.get('total_fat', '0')}g", f"{total_fat_dv}%"],
-            ["   Saturated Fat", f"{nutrition_data.get('saturated_fat', '0')}g", f"{saturated_fat_dv}%"],
-            ["   Trans Fat", f"{nutrition_data.get('trans_fat', '0')}g", ""],
-            ["Cholesterol", f"{nutrition_data.get('cholesterol', '0')}mg", f"{cholesterol_dv}%"],
-            ["Sodium", f"{nutrition_data.get('sodium', '0')}mg", f"{sodium_dv}%"],
-            ["Total Carbohydrates", f"{nutrition_data.get('total_carbs', '0')}g", f"{total_carbs_dv}%"],
-            ["   Dietary Fiber", f"{nutrition_data.get('dietary_fiber', '0')}g", f"{dietary_fiber_dv}%"],
-            ["   Total Sugars", f"{nutrition_data.get('total_sugars', '0')}g", ""],
-            ["      Added Sugars", f"{nutrition_data.get('added_sugars', '0')}g", f"{added_sugars_dv}%"],
-            ["Protein", f"{nutrition_data.get('protein', '0')}g", ""],
-            ["Vitamin D", f"{nutrition_data.get('vitamin_d', '0')}mcg", f"{vitamin_d_dv}%"],
-            ["Calcium", f"{nutrition_data.get('calcium', '0')}mg", f"{calcium_dv}%"],
-            ["Iron", f"{nutrition_data.get('iron', '0')}mg", f"{iron_dv}%"],
-            ["Potassium", f"{nutrition_data.get('potassium', '0')}mg", f"{potassium_dv}%"]
-        ]
+    if format_type in DETAILED_FORMATS:
+        # One table row per nutrient, indented under its parent
+        data = [["Nutrient", "Amount", "% Daily Value*"]]
+        for row in NUTRIENT_ROWS:
+            data.append([
+                "   " * row.indent + row.label,
+                f"{values[row.field]}{row.unit}",
+                f"{values[row.field + '_dv']}%" if row.dv else ""
+            ])
         
         # Create the table
-        table = Table(data, colWidths=[2.5*inch, 1*inch, 1*inch])
-        
-        # Add style
-        table_style = TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 12),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.white),
-            ('TEXTCOLOR', (0, 1), (-1, -1), colors.black),
-            ('ALIGN', (1, 1), (1, -1), 'CENTER'),
-            ('ALIGN', (2, 1), (2, -1), 'CENTER'),
-            ('FONTNAME', (0, 1), (0, -1), 'Helvetica'),
-            ('FONTNAME', (0, 1), (0, 1), 'Helvetica-Bold'),  # Total Fat
-            ('FONTNAME', (0, 4), (0, 6), 'Helvetica-Bold'),  # Cholesterol, Sodium, Total Carbs
-            ('FONTNAME', (0, 10), (0, 10), 'Helvetica-Bold'),  # Protein
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ])
-        
-        table.setStyle(table_style)
+        table = Table(data, colWidths=[2.5*inch*scale, 1*inch*scale, 1*inch*scale])
+        table.setStyle(styles["detailed_table"])
         elements.append(table)
     
     # Simplified format
     else:
         # Create a simpler table for colored and simplified formats
-        # Calculate daily values
-        total_fat_dv = calculate_dv(nutrition_data.get('total_fat'), DAILY_VALUES["total_fat"])
-        total_carbs_dv = calculate_dv(nutrition_data.get('total_carbs'), DAILY_VALUES["total_carbs"])
-        sodium_dv = calculate_dv(nutrition_data.get('sodium'), DAILY_VALUES["sodium"])
-        protein = nutrition_data.get('protein', '0')
-        
-        # Main nutrients table
         main_data = [
-            ["Total Fat", "Total Carbs", "Sodium", "Protein"],
-            [f"{nutrition_data.get('total_fat', '0')}g", f"{nutrition_data.get('total_carbs', '0')}g", f"{nutrition_data.get('sodium', '0')}mg", f"{protein}g"],
-            [f"{total_fat_dv}% DV", f"{total_carbs_dv}% DV", f"{sodium_dv}% DV", "-"]
+            [label for _, label, _ in SUMMARY_COLUMNS],
+            [f"{values[field]}{unit}" for field, _, unit in SUMMARY_COLUMNS],
+            [f"{values[field + '_dv']}% DV" if field + '_dv' in values else "-" for field, _, _ in SUMMARY_COLUMNS]
         ]
         
-        main_table = Table(main_data, colWidths=[1.1*inch, 1.1*inch, 1.1*inch, 1.1*inch])
-        
-        # Style for the simplified table
-        main_style = TableStyle([
-            ('BACKGROUND', (0, 0), (0, 0), colors.lightblue),
-            ('BACKGROUND', (1, 0), (1, 0), colors.lightgreen),
-            ('BACKGROUND', (2, 0), (2, 0), colors.salmon),
-            ('BACKGROUND', (3, 0), (3, 0), colors.lavender),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 6),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ])
-        
-        main_table.setStyle(main_style)
+        main_table = Table(main_data, colWidths=[1.1*inch*scale] * len(SUMMARY_COLUMNS))
+        main_table.setStyle(styles["simplified_table"])
         elements.append(main_table)
         
         # Add some space
-        elements.append(Spacer(1, 0.3*inch))
+        elements.append(Spacer(1, 0.3*inch*scale))
     
     # Footer note
-    footnote_style = ParagraphStyle('Footnote', parent=styles['Normal'])
-    footnote_style.fontSize = 8
-    elements.append(Paragraph("* The % Daily Value (DV) tells you how much a nutrient in a serving of food contributes to a daily diet. 2,000 calories a day is used for general nutrition advice.", footnote_style))
+    elements.append(Paragraph(FOOTNOTE_TEXT, styles["footnote"]))
+    
+    return elements
+
+def create_nutrition_label_pdf(label, format_type="standard"):
+    """Create a PDF with the nutrition label"""
+    buffer = BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter,
+                            rightMargin=72, leftMargin=72,
+                            topMargin=72, bottomMargin=72)
     
     # Build the document
-    doc.build(elements)
+    with stage("pdf_build"):
+        doc.build(build_label_flowables(label, format_type))
     
     # Get the value from the BytesIO buffer
     pdf_value = buffer.getvalue()
     buffer.close()
     
-    return pdf_value
\ No newline at end of file
+    return pdf_value
+
+def _natural_label_size(format_type):
+    # Width and height at scale 1 of a label whose product name takes two
+    # lines, measured once for the detailed and once for the summary layout
+    detailed = format_type in DETAILED_FORMATS
+    with _styles_lock:
+        size = _natural_sizes.get(detailed)
+    if size is None:
+        sample = LabelData.from_payload({"product_name": "Nutrition Facts " * 8, "servings_per_container": "1"})
+        flowables = build_label_flowables(sample, format_type)
+        width = max(flowable.wrap(inch * 100, inch * 100)[0] for flowable in flowables if isinstance(flowable, Table))
+        height = sum(
+            flowable.wrap(width, inch * 100)[1] + flowable.getSpaceBefore() + flowable.getSpaceAfter()
+            for flowable in flowables
+        )
+        size = (width, height)
+        with _styles_lock:
+            _natural_sizes[detailed] = size
+    return size
+
+def sheet_label_scale(format_type, width, height):
+    """Return the scale that fits a label of this format in a width x height cell, never above 1"""
+    natural_width, natural_height = _natural_label_size(format_type)
+    # Rounded down so every cell of a grid shares one set of scaled styles
+    scale = min(1.0, width / natural_width, height / natural_height)
+    return int(scale * 1000) / 1000
+
+def create_label_sheet_pdf(labels, columns=2, rows=2):
+    """Create one PDF of (LabelData, format_type) labels laid out columns x rows per page"""
+    buffer = BytesIO()
+    margin = 0.5*inch
+    doc = SimpleDocTemplate(buffer, pagesize=letter,
+                            rightMargin=margin, leftMargin=margin,
+                            topMargin=margin, bottomMargin=margin)
+    
+    # Cell size: the page frame keeps 6pt of padding on each side, and a
+    # point of slack stops rounding from pushing a grid onto a second page.
+    # Each grid fills a page, so the next one always starts on a new page.
+    cell_width = (doc.width - 13) / columns
+    cell_height = (doc.height - 13) / rows
+    padding = 12
+    
+    elements = []
+    per_page = columns * rows
+    for start in range(0, len(labels), per_page):
+        # Each label is built at its cell's size, so nothing is rewrapped to fit
+        cells = [
+            build_label_flowables(label, format_type, sheet_label_scale(format_type, cell_width - padding, cell_height - padding))
+            for label, format_type in labels[start:start + per_page]
+        ]
+        
+        # Pad the last page so the grid keeps its shape
+        cells += [""] * (per_page - len(cells))
+        grid = [cells[row * columns:(row + 1) * columns] for row in range(rows)]
+        
+        sheet = Table(grid, colWidths=[cell_width] * columns, rowHeights=[cell_height] * rows)
+        sheet.setStyle(SHEET_TABLE_STYLE)
+        elements.append(sheet)
+    
+    # One build for the whole catalog
+    with stage("pdf_build"):
+        doc.build(elements)
+    
+    pdf_value = buffer.getvalue()
+    buffer.close()
+    
+    return pdf_value
@@ -0,0 +1,102 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+import uuid
+
+# Open preview sessions kept per process, and how long an idle one lives
+# (seconds). Each session holds its own canvas in memory: 1.6 MB for a
+# standard-tier 500x800 RGBA label, but up to ~25 MB at the print tier or
+# a large width, so the canvases are also bounded by their total bytes.
+PREVIEW_SESSION_MAX = int(os.environ.get('PREVIEW_SESSION_MAX', 64))
+PREVIEW_SESSION_MAX_BYTES = int(os.environ.get('PREVIEW_SESSION_MAX_BYTES', 128 * 1024 * 1024))
+PREVIEW_SESSION_TTL = int(os.environ.get('PREVIEW_SESSION_TTL', 600))
+
+class PreviewSession:
+    """The label data and rendered canvas behind one client's live preview"""
+
+    __slots__ = ("label", "format_type", "output_format", "canvas", "nbytes", "last_used", "lock")
+
+    def __init__(self, label, format_type, output_format, options=None):
+        self.label = label
+        self.format_type = format_type
+        self.output_format = output_format
+        # Imported on first use so app startup doesn't load Pillow
+        from .simple_image_generator import create_label_canvas
+        self.canvas = create_label_canvas(label, format_type, output_format, options)
+        width, height = self.canvas.image.size
+        self.nbytes = width * height * len(self.canvas.image.getbands())
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+class PreviewSessionStore:
+    """Bounded LRU of preview sessions that also drops sessions idle for longer than the TTL"""
+
+    def __init__(self, max_sessions=PREVIEW_SESSION_MAX, ttl=PREVIEW_SESSION_TTL, max_bytes=PREVIEW_SESSION_MAX_BYTES):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def open(self, label, format_type, output_format, options=None):
+        """Render a label in a new session; returns (session id, encoded image). Raises ValueError if its canvas can't fit."""
+        session = PreviewSession(label, format_type, output_format, options)
+        if session.nbytes > self.max_bytes:
+            raise ValueError("Preview canvas is too large for a session; use a smaller quality or width")
+        data = session.canvas.encode()
+
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._expire()
+            self._sessions[session_id] = session
+            self._size += session.nbytes
+            # Least recently used sessions go first, by count and by canvas bytes
+            while len(self._sessions) > self.max_sessions or self._size > self.max_bytes:
+                _, evicted = self._sessions.popitem(last=False)
+                self._size -= evicted.nbytes
+        return session_id, data
+
+    def update(self, session_id, changes):
+        """Apply field changes to a session; returns (encoded image, output format, ops redrawn), or None if it expired"""
+        with self._lock:
+            self._expire()
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            session.last_used = time.monotonic()
+
+        # Edits to one session are applied in order; other sessions are not held up
+        with session.lock:
+            session.label = session.label.replace(changes)
+            redrawn = session.canvas.update(session.label)
+            return session.canvas.encode(), session.output_format, redrawn
+
+    def close(self, session_id):
+        """Forget a session; returns whether it existed"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session is None:
+                return False
+            self._size -= session.nbytes
+            return True
+
+    def stats(self):
+        """Return the number of open sessions, the bytes their canvases hold and the limits"""
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "bytes": self._size, "max_bytes": self.max_bytes}
+
+    def _expire(self):
+        # Oldest entries come first, so stop at the first one still in use
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            del self._sessions[session_id]
+            self._size -= session.nbytes
+
+# Process-wide preview sessions shared by the routes
+preview_sessions = PreviewSessionStore()
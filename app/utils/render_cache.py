@@ -0,0 +1,274 @@
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Memory budget for cached renders (bytes) and optional directory for the disk tier
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+RENDER_CACHE_DIR = os.environ.get('RENDER_CACHE_DIR')
+
+# Disk budget for the disk tier (bytes) and how long an unread render is
+# kept there (seconds). Every distinct preview edit lands on disk, so the
+# directory is swept: expired files go first, then the least recently used
+# until it's back under 90% of the budget.
+RENDER_CACHE_DISK_MAX_BYTES = int(os.environ.get('RENDER_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024))
+RENDER_CACHE_DISK_TTL = int(os.environ.get('RENDER_CACHE_DISK_TTL', 7 * 24 * 3600))
+
+# Longest gap between two sweeps of the disk tier while renders are being
+# written (seconds); writing a tenth of the budget triggers one sooner
+RENDER_CACHE_DISK_SWEEP_INTERVAL = 60
+
+# How often a request waiting on someone else's render checks whether its
+# own client is still there (seconds)
+RENDER_WAIT_POLL_INTERVAL = 0.05
+
+class RenderCancelled(Exception):
+    """The client asking for a render went away before it was needed"""
+
+def make_cache_key(label, format_type, output_format, version=""):
+    """Build a content hash for a label's content, label format, output type and renderer version"""
+    # The label's own values are already hashed, so this only hashes a few short strings
+    payload = json.dumps(
+        [label.content_hash, format_type or "standard", (output_format or "png").lower(), version],
+        separators=(",", ":")
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class RenderCache:
+    """Bounded LRU of rendered label bytes with an optional on-disk tier"""
+
+    def __init__(self, max_bytes=RENDER_CACHE_MAX_BYTES, disk_dir=RENDER_CACHE_DIR,
+                 disk_max_bytes=RENDER_CACHE_DISK_MAX_BYTES, disk_ttl=RENDER_CACHE_DISK_TTL):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_ttl = disk_ttl
+        self._entries = OrderedDict()
+        self._size = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "coalesced": 0, "cancelled": 0, "disk_evictions": 0}
+        
+        # Bytes written to disk since the last sweep, and when it ran; the
+        # first write sweeps whatever earlier processes left behind
+        self._disk_written = 0
+        self._last_sweep = None
+        self._sweep_lock = threading.Lock()
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def get(self, key):
+        """Return the cached bytes for a key, or None"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self._stats["hits"] += 1
+                return data
+
+        data = self._read_disk(key)
+        with self._lock:
+            if data is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._store(key, data)
+        return data
+
+    def put(self, key, data):
+        """Store rendered bytes in memory (and on disk when the disk tier is enabled)"""
+        with self._lock:
+            self._store(key, data)
+        self._write_disk(key, data)
+
+    def get_or_render(self, key, render, cancelled=None):
+        """Return cached bytes for a key, calling render() and caching its result on a miss"""
+        while True:
+            data = self.get(key)
+            if data is not None:
+                return data
+
+            # Concurrent misses for one key share a single render: the first
+            # caller renders, the rest wait for its result
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = self._inflight[key] = Future()
+                else:
+                    self._stats["coalesced"] += 1
+
+            if leader:
+                return self._render(key, render, future, cancelled)
+
+            try:
+                return self._wait(future, cancelled)
+            except RenderCancelled:
+                if cancelled is not None and cancelled():
+                    self._count_cancelled()
+                    raise
+                # The leader's client left, not ours; try again (usually as the new leader)
+
+    def _render(self, key, render, future, cancelled):
+        try:
+            # Don't start a render nobody is waiting for
+            if cancelled is not None and cancelled():
+                raise RenderCancelled()
+            data = render()
+            self.put(key, data)
+        except BaseException as e:
+            if isinstance(e, RenderCancelled):
+                self._count_cancelled()
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(data)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return data
+
+    def _wait(self, future, cancelled):
+        # cancelled() is polled while the leader renders so a follower whose
+        # client disconnected stops waiting
+        while True:
+            try:
+                return future.result(timeout=RENDER_WAIT_POLL_INTERVAL)
+            except TimeoutError:
+                if cancelled is not None and cancelled():
+                    raise RenderCancelled()
+
+    def _count_cancelled(self):
+        with self._lock:
+            self._stats["cancelled"] += 1
+
+    def stats(self):
+        """Return hit/miss/eviction counters and current memory usage"""
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._size, max_bytes=self.max_bytes)
+
+    def clear(self):
+        """Drop every in-memory entry (the disk tier is left alone)"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _store(self, key, data):
+        # Renders bigger than the whole budget are never kept in memory
+        if len(data) > self.max_bytes:
+            return
+
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._size -= len(previous)
+
+        self._entries[key] = data
+        self._size += len(data)
+
+        # Evict least recently used entries until we are back under budget
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self._stats["evictions"] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key)
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Reads count as use, so the sweep evicts renders nobody asks for first
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _write_disk(self, key, data):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temp file first so readers never see a partial render
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            # The disk tier is best effort; the in-memory copy is still valid
+            return
+        
+        now = time.monotonic()
+        with self._lock:
+            self._disk_written += len(data)
+            due = (
+                self._last_sweep is None
+                or now - self._last_sweep >= RENDER_CACHE_DISK_SWEEP_INTERVAL
+                or self._disk_written >= self.disk_max_bytes // 10
+            )
+        if due:
+            self.sweep_disk()
+    
+    def sweep_disk(self):
+        """Delete expired renders from the disk tier, then the least recently used ones until it's under budget"""
+        if not self.disk_dir or not self._sweep_lock.acquire(blocking=False):
+            # Another thread is already sweeping
+            return
+        try:
+            with self._lock:
+                self._disk_written = 0
+                self._last_sweep = time.monotonic()
+            
+            expires = time.time() - self.disk_ttl
+            files = []
+            total = 0
+            removed = 0
+            for shard in os.scandir(self.disk_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    # Skip temp files still being written
+                    if entry.name.startswith("tmp"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                        if stat.st_mtime < expires:
+                            os.remove(entry.path)
+                            removed += 1
+                            continue
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+            
+            if total > self.disk_max_bytes:
+                files.sort()
+                target = self.disk_max_bytes * 9 // 10
+                for _, size, path in files:
+                    if total <= target:
+                        break
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        continue
+                    total -= size
+                    removed += 1
+            
+            with self._lock:
+                self._stats["disk_evictions"] += removed
+        except OSError:
+            pass
+        finally:
+            self._sweep_lock.release()
+
+# Process-wide render cache shared by the routes
+render_cache = RenderCache()
@@ -0,0 +1,198 @@
+import os
+import tempfile
+import threading
+import time
+
+from ..models.database import LabelRendition, SessionLocal
+from .batch_renderer import get_render_pool
+from .label_renderer import normalize_output_format, render_key, render_label_uncached
+
+# Get base directory for the default rendition directory
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Opt-in: render the listed output formats of a label in the background
+# whenever it is saved, so downloads can be served without rendering
+PRERENDER_ON_SAVE = os.environ.get('PRERENDER_ON_SAVE', '0').lower() in ('1', 'true', 'yes')
+PRERENDER_FORMATS = tuple(
+    normalize_output_format(output_format.strip())
+    for output_format in os.environ.get('PRERENDER_FORMATS', 'png,jpg,pdf').split(',')
+    if output_format.strip()
+)
+
+# Where stored renditions live: "filesystem" (RENDITION_DIR) or "database"
+# (the label_renditions table)
+RENDITION_STORE = os.environ.get('RENDITION_STORE', 'filesystem')
+RENDITION_DIR = os.environ.get('RENDITION_DIR', os.path.join(BASE_DIR, 'instance', 'renditions'))
+
+class FileRenditionStore:
+    """Renditions stored as files under <directory>/<label id>/<content hash>.<format>"""
+
+    def __init__(self, directory=RENDITION_DIR):
+        self.directory = directory
+
+    def path(self, label_id, key, output_format):
+        return os.path.join(self.directory, str(label_id), f"{key}.{output_format}")
+
+    def get(self, label_id, key, output_format):
+        try:
+            with open(self.path(label_id, key, output_format), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def exists(self, label_id, key, output_format):
+        return os.path.exists(self.path(label_id, key, output_format))
+
+    def put(self, label_id, key, output_format, data):
+        path = self.path(label_id, key, output_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so downloads never see a partial rendition
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def prune(self, label_id, keep):
+        """Delete a label's renditions whose content hash is not in keep"""
+        directory = os.path.join(self.directory, str(label_id))
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return
+        for name in names:
+            if name.split(".")[0] not in keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+
+class DatabaseRenditionStore:
+    """Renditions stored as rows of the label_renditions table"""
+
+    def get(self, label_id, key, output_format):
+        db = SessionLocal()
+        try:
+            row = (
+                db.query(LabelRendition.data)
+                .filter(LabelRendition.label_id == label_id, LabelRendition.content_hash == key)
+                .first()
+            )
+            return row[0] if row is not None else None
+        finally:
+            db.close()
+
+    def exists(self, label_id, key, output_format):
+        db = SessionLocal()
+        try:
+            return db.query(
+                db.query(LabelRendition)
+                .filter(LabelRendition.label_id == label_id, LabelRendition.content_hash == key)
+                .exists()
+            ).scalar()
+        finally:
+            db.close()
+
+    def put(self, label_id, key, output_format, data):
+        db = SessionLocal()
+        try:
+            db.merge(LabelRendition(
+                label_id=label_id,
+                content_hash=key,
+                output_format=output_format,
+                data=data,
+                created_at=time.time()
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def prune(self, label_id, keep):
+        """Delete a label's renditions whose content hash is not in keep"""
+        db = SessionLocal()
+        try:
+            (
+                db.query(LabelRendition)
+                .filter(LabelRendition.label_id == label_id, LabelRendition.content_hash.notin_(list(keep)))
+                .delete(synchronize_session=False)
+            )
+            db.commit()
+        finally:
+            db.close()
+
+RENDITION_STORES = {
+    "filesystem": FileRenditionStore,
+    "database": DatabaseRenditionStore
+}
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_rendition_store():
+    """Return the configured rendition store, or None when pre-rendering is off"""
+    global _store
+    if not PRERENDER_ON_SAVE:
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = RENDITION_STORES[RENDITION_STORE]()
+        return _store
+
+def stored_rendition(label_id, key, output_format):
+    """Return the stored bytes of a rendition, or None on a miss"""
+    store = get_rendition_store()
+    if store is None:
+        return None
+    try:
+        return store.get(label_id, key, output_format)
+    except Exception:
+        # A broken store only costs us the shortcut; the caller renders live
+        return None
+
+def rendition_path(label_id, key, output_format):
+    """Return the file holding a stored rendition, or None when it isn't on disk"""
+    store = get_rendition_store()
+    if not isinstance(store, FileRenditionStore):
+        return None
+    # Absolute, since Flask resolves relative paths against the app package
+    path = os.path.abspath(store.path(label_id, key, output_format))
+    return path if os.path.isfile(path) else None
+
+def store_rendition(label_id, key, output_format, data):
+    """Keep a rendition that was rendered live so the next download is served from the store"""
+    store = get_rendition_store()
+    if store is None:
+        return
+    try:
+        store.put(label_id, key, output_format, data)
+    except Exception:
+        pass
+
+def prerender_label(label_id, label, format_type):
+    """Render a saved label's configured renditions in the background and store them"""
+    store = get_rendition_store()
+    if store is None:
+        return
+
+    keys = {}
+    for output_format in PRERENDER_FORMATS:
+        keys[render_key(label, format_type, output_format)] = output_format
+
+    # Renditions of the label's previous content are no longer served
+    store.prune(label_id, set(keys))
+
+    for key, output_format in keys.items():
+        if store.exists(label_id, key, output_format):
+            continue
+        future = get_render_pool().submit(render_label_uncached, label, format_type, output_format)
+        future.add_done_callback(
+            lambda future, key=key, output_format=output_format: _store_result(store, label_id, key, output_format, future)
+        )
+
+def _store_result(store, label_id, key, output_format, future):
+    # Runs on the pool's result thread; a failed render just leaves a miss
+    if future.cancelled() or future.exception() is not None:
+        return
+    try:
+        store.put(label_id, key, output_format, future.result())
+    except Exception:
+        pass
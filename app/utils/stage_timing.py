@@ -0,0 +1,192 @@
+from contextlib import nullcontext
+from contextvars import ContextVar
+import os
+import random
+import threading
+import time
+
+from flask import request
+from sqlalchemy import event
+
+from .label_layout import LABEL_FORMATS
+
+# Fraction of requests timed stage by stage (0 turns it off; untimed
+# requests only pay for a context variable lookup per stage)
+TIMING_SAMPLE_RATE = float(os.environ.get('TIMING_SAMPLE_RATE', 1.0))
+
+# Whether timed requests report their stages in a Server-Timing header
+SERVER_TIMING_HEADER = os.environ.get('SERVER_TIMING_HEADER', '1').lower() in ('1', 'true', 'yes')
+
+# Histogram bucket upper bounds (seconds)
+TIMING_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Labels every histogram series carries
+METRIC_LABELS = ("route", "format_type", "output_format")
+
+_current = ContextVar("stage_timer", default=None)
+_untimed = nullcontext()
+
+class StageTimer:
+    """Stage durations of one request"""
+
+    __slots__ = ("start", "stages", "stack", "format_type", "output_format")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.stack = []
+        self.format_type = ""
+        self.output_format = ""
+
+    def add(self, name, seconds, nested=0.0):
+        """Charge a stage for time spent outside the stages nested in it"""
+        # Stages nest (DV math runs inside drawing), so each is charged only
+        # its own time and the stages never add up to more than the total
+        self.stages[name] = self.stages.get(name, 0.0) + seconds - nested
+        if self.stack:
+            self.stack[-1][1] += seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+class _Stage:
+    __slots__ = ("timer", "name", "frame")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        # [start, time spent in nested stages]
+        self.frame = [time.perf_counter(), 0.0]
+        self.timer.stack.append(self.frame)
+
+    def __exit__(self, *exc):
+        self.timer.stack.pop()
+        start, nested = self.frame
+        self.timer.add(self.name, time.perf_counter() - start, nested)
+        return False
+
+def stage(name):
+    """Context manager timing one stage of the current request (a no-op when it isn't sampled)"""
+    timer = _current.get()
+    if timer is None:
+        return _untimed
+    return _Stage(timer, name)
+
+def tag_render(format_type, output_format):
+    """Record which label format and output format the current request renders"""
+    timer = _current.get()
+    if timer is not None:
+        # Unknown formats render as "simplified", and counting them under
+        # their own names would let requests create any number of series
+        timer.format_type = format_type if format_type in LABEL_FORMATS else "simplified"
+        timer.output_format = output_format or ""
+
+def start_timing():
+    """Start timing this request if it is sampled"""
+    if TIMING_SAMPLE_RATE > 0 and (TIMING_SAMPLE_RATE >= 1 or random.random() < TIMING_SAMPLE_RATE):
+        _current.set(StageTimer())
+    else:
+        _current.set(None)
+
+def finish_timing(route):
+    """Stop timing this request and record it; returns the timer, or None if it wasn't sampled"""
+    timer = _current.get()
+    if timer is None:
+        return None
+    _current.set(None)
+
+    total = timer.elapsed()
+    labels = (route, timer.format_type, timer.output_format)
+    request_seconds.observe(labels, total)
+    for name, seconds in timer.stages.items():
+        stage_seconds.observe(labels + (name,), seconds)
+    timer.stages["total"] = total
+    return timer
+
+def server_timing_header(timer):
+    """Format a timer's stages as a Server-Timing header value"""
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timer.stages.items())
+
+def record_request_timing(response):
+    """after_request hook: record a sampled request's stages and add its Server-Timing header"""
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    timer = finish_timing(route)
+    if timer is not None and SERVER_TIMING_HEADER:
+        response.headers["Server-Timing"] = server_timing_header(timer)
+    return response
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("stage_timing", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timer = _current.get()
+    starts = conn.info.get("stage_timing")
+    if timer is not None and starts:
+        timer.add("db", time.perf_counter() - starts.pop())
+
+def instrument_engine(engine):
+    """Time every SQL statement run on an engine as the "db" stage"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class Histogram:
+    """Prometheus-style cumulative histogram keyed by label values"""
+
+    def __init__(self, name, help_text, label_names, buckets=TIMING_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts (made cumulative on export), then sum and count
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """Return the histogram in the Prometheus text exposition format"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(counts), total, count]) for labels, (counts, total, count) in self._series.items())
+        for labels, (counts, total, count) in series:
+            label_text = ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(self.label_names, labels))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {total:.6f}")
+            lines.append(f"{self.name}_count{{{label_text}}} {count}")
+        return "\n".join(lines) + "\n"
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+request_seconds = Histogram(
+    "nutrition_labeler_request_seconds",
+    "Time spent handling sampled requests",
+    METRIC_LABELS
+)
+stage_seconds = Histogram(
+    "nutrition_labeler_stage_seconds",
+    "Time sampled requests spent in each stage (db, dv, draw, encode, pdf_build), excluding nested stages",
+    METRIC_LABELS + ("stage",)
+)
+
+def render_metrics():
+    """Return every timing histogram in the Prometheus text exposition format"""
+    return request_seconds.render() + stage_seconds.render()
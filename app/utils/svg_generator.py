@@ -0,0 +1,122 @@
+from functools import lru_cache
+from html import escape
+import re
+
+from .label_layout import FONTS, get_layout, label_values
+from .stage_timing import stage
+
+# The raster renderers draw with DejaVu Sans; viewers without it fall back
+FONT_FAMILY = "'DejaVu Sans',Verdana,Arial,sans-serif"
+FONT_WEIGHTS = {"regular": "normal", "bold": "bold"}
+
+# Pillow text anchors are two letters (horizontal, vertical); these are the
+# SVG equivalents. "la" is Pillow's default.
+TEXT_ANCHORS = {"l": "start", "m": "middle", "r": "end"}
+BASELINES = {"a": "hanging", "t": "hanging", "m": "central", "s": "alphabetic", "b": "text-after-edge", "d": "text-after-edge"}
+
+# Gap Pillow leaves between the lines of multiline text (pixels)
+MULTILINE_SPACING = 4
+
+# Characters XML doesn't allow in text, even escaped
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+def _color(rgb):
+    return "#%02x%02x%02x" % rgb
+
+def _text(value):
+    return escape(_INVALID_XML.sub("", str(value)), quote=False)
+
+def _text_attrs(xy, font, fill, anchor):
+    # Font roles and anchors are CSS classes defined once in the <style> block
+    attrs = f'x="{xy[0]}" y="{xy[1]}" class="{font} {anchor}"'
+    if fill != (0, 0, 0):
+        attrs += f' fill="{_color(fill)}"'
+    return attrs
+
+def _style(ops):
+    # Only the font roles and anchors the layout uses get a rule
+    fonts = sorted({op[3] for op in ops if op[0] in ("text", "multiline")})
+    anchors = sorted({_anchor_class(op) for op in ops if op[0] in ("text", "multiline")})
+    rules = [f"text{{font-family:{FONT_FAMILY};white-space:pre}}"]
+    for role in fonts:
+        face, size = FONTS[role]
+        rules.append(f".{role}{{font-size:{size}px;font-weight:{FONT_WEIGHTS[face]}}}")
+    for anchor in anchors:
+        rules.append(f".{anchor}{{text-anchor:{TEXT_ANCHORS[anchor[0]]};dominant-baseline:{BASELINES[anchor[1]]}}}")
+    return "<style>" + "".join(rules) + "</style>"
+
+def _anchor_class(op):
+    if op[0] == "multiline":
+        # Centered blocks (the only kind layouts use) put each line's middle on x
+        _, _, _, _, _, anchor, align = op
+        return ("m" if align == "center" else (anchor or "la")[0]) + "m"
+    return op[5] or "la"
+
+def _static_element(op):
+    kind = op[0]
+    if kind == "line":
+        _, ((x1, y1), (x2, y2)), fill, width = op
+        return f'<line x1="{x1}" y1="{y1}" x2="{x2}" y2="{y2}" stroke="{_color(fill)}" stroke-width="{width}"/>'
+    if kind == "rect":
+        # Pillow boxes include their far corner and draw outlines inside the box
+        _, ((x0, y0), (x1, y1)), fill, outline, width = op
+        inset = width / 2 if outline is not None else 0
+        attrs = f'x="{x0 + inset:g}" y="{y0 + inset:g}" width="{x1 - x0 + 1 - 2*inset:g}" height="{y1 - y0 + 1 - 2*inset:g}"'
+        attrs += f' fill="{_color(fill)}"' if fill is not None else ' fill="none"'
+        if outline is not None:
+            attrs += f' stroke="{_color(outline)}" stroke-width="{width}"'
+        return f"<rect {attrs}/>"
+    if kind == "multiline":
+        _, (x, y), value, font, fill, _, _ = op
+        lines = value.split("\n")
+        step = FONTS[font][1] + MULTILINE_SPACING
+        first = y - (len(lines) - 1) * step / 2
+        spans = "".join(
+            f'<tspan x="{x}" dy="{0 if index == 0 else step}">{_text(text)}</tspan>'
+            for index, text in enumerate(lines)
+        )
+        return f'<text {_text_attrs((x, f"{first:g}"), font, fill, _anchor_class(op))}>{spans}</text>'
+    _, xy, value, font, fill, _ = op
+    return f"<text {_text_attrs(xy, font, fill, _anchor_class(op))}>{_text(value)}</text>"
+
+@lru_cache(maxsize=None)
+def compiled_svg(format_type):
+    """Return (width, height, static markup, dynamic text ops) of a format's layout as SVG"""
+    layout = get_layout(format_type)
+    static = _style(layout.static_ops + layout.dynamic_ops) + "".join(_static_element(op) for op in layout.static_ops)
+    # Each dynamic op becomes an opening tag plus the template filled in per render
+    dynamic = tuple(
+        (f"<text {_text_attrs(op[1], op[3], op[4], _anchor_class(op))}>", op[2])
+        for op in layout.dynamic_ops
+    )
+    width, height = layout.size
+    return width, height, static, dynamic
+
+def output_size(width, height, options=None):
+    """Width and height attributes of a label drawn at the size in options (a width wins over a scale)"""
+    if options is None:
+        return width, height
+    if options.width:
+        return options.width, round(height * options.width / width)
+    return round(width * options.scale), round(height * options.scale)
+
+def render_layout_svg(format_type, label, options=None):
+    """Render a label with the compiled layout of a format as SVG bytes"""
+    with stage("draw"):
+        width, height, static, dynamic = compiled_svg(get_layout(format_type).name)
+        values = label_values(label)
+
+        # The artwork stays in layout units; the size options only change how big it is shown
+        out_width, out_height = output_size(width, height, options)
+        parts = [
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{out_width}" height="{out_height}" viewBox="0 0 {width} {height}">',
+            static
+        ]
+        for tag, template in dynamic:
+            parts.append(tag + _text(template.format_map(values)) + "</text>")
+        parts.append("</svg>")
+        return "".join(parts).encode("utf-8")
+
+def create_nutrition_label_svg(label, format_type="standard", options=None):
+    """Create an SVG with the nutrition label"""
+    return render_layout_svg(format_type, label, options)
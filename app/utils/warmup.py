@@ -0,0 +1,88 @@
+import os
+import threading
+import time
+
+from ..models.label_data import LabelData
+from .label_layout import LABEL_FORMATS, NUTRIENT_ROWS
+from .label_renderer import MIMETYPES, render_label_uncached, render_options
+
+# Quality tiers drawn during warm-up. Print-tier canvases are large and rare,
+# so by default they're left to the first print request.
+WARMUP_TIERS = [tier.strip() for tier in os.environ.get('WARMUP_TIERS', 'preview,standard').split(',') if tier.strip()]
+
+# Throwaway label with every field filled, so each text op and glyph is drawn
+WARMUP_LABEL = LabelData.from_payload(dict(
+    {row.field: "1" for row in NUTRIENT_ROWS},
+    product_name="Warm-up",
+    serving_size="1 cup (100g)",
+    servings_per_container="1",
+    calories="100"
+))
+
+_ready = threading.Event()
+_lock = threading.Lock()
+_started = False
+_stats = {"renders": 0, "seconds": None}
+
+def warm_up(app=None):
+    """Load fonts, ReportLab styles, layouts and encoders by rendering a throwaway label in every format.
+
+    Run in the gunicorn master before it forks (see gunicorn.conf.py) so every
+    worker starts warm and shares the result copy-on-write. Touches neither
+    the database nor the render cache. If a warm-up is already running this
+    waits for it instead of starting another.
+    """
+    if _claim():
+        _run(app)
+    else:
+        _ready.wait()
+
+def ensure_warm_up(app=None):
+    """Start warming up in the background unless it already ran or is running; returns whether it's done"""
+    # Processes the master didn't warm (the dev server, gunicorn without
+    # gunicorn.conf.py) warm themselves the first time readiness is checked
+    if not _ready.is_set() and _claim():
+        threading.Thread(target=_run, args=(app,), name="warm-up", daemon=True).start()
+    return _ready.is_set()
+
+def _claim():
+    # Only the flag is guarded, so readiness checks never wait on the renders
+    global _started
+    with _lock:
+        if _started:
+            return False
+        _started = True
+        return True
+
+def _run(app):
+    global _started
+    start = time.perf_counter()
+    renders = 0
+    try:
+        for tier in WARMUP_TIERS:
+            options = render_options(quality=tier)
+            for format_type in LABEL_FORMATS:
+                for output_format in MIMETYPES:
+                    # PDFs ignore the tier, so one per layout is enough
+                    if output_format == "pdf" and tier != WARMUP_TIERS[0]:
+                        continue
+                    render_label_uncached(WARMUP_LABEL, format_type, output_format, options)
+                    renders += 1
+
+        # Compile the page templates as well
+        if app is not None:
+            for name in app.jinja_env.list_templates():
+                app.jinja_env.get_template(name)
+    except BaseException:
+        # Let the next readiness check try again
+        with _lock:
+            _started = False
+        raise
+
+    _stats["renders"] = renders
+    _stats["seconds"] = time.perf_counter() - start
+    _ready.set()
+
+def warm_up_stats():
+    """Return whether warm-up finished, and the renders and seconds it took"""
+    return dict(_stats, ready=_ready.is_set())
@@ -0,0 +1,37 @@
+import zipfile
+
+class _StreamBuffer:
+    """Write-only file object that hands whatever was written back to the generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def stream_zip(entries):
+    """Yield a ZIP archive chunk by chunk from (name, data) entries, holding only one entry at a time"""
+    # The buffer can't seek, so zipfile writes data descriptors after each
+    # entry instead of patching headers in already-sent output. Entries are
+    # stored since PNG, JPG and PDF output is already compressed.
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, data in entries:
+            archive.writestr(name, data)
+            chunk = buffer.drain()
+            if chunk:
+                yield chunk
+
+    # Central directory written when the archive closes
+    chunk = buffer.drain()
+    if chunk:
+        yield chunk
@@ -0,0 +1,68 @@
+"""Renders per second for each label format with and without the cached label chrome.
+
+Usage: python -m benchmarks.chrome_benchmark [--seconds 1.0] [--file-format png]
+"""
+import argparse
+import time
+
+from app.models.label_data import LabelData
+from app.utils import image_generator, simple_image_generator
+
+SAMPLE_LABEL = LabelData.from_payload({
+    "product_name": "Granola Bar",
+    "serving_size": "40",
+    "servings_per_container": "8",
+    "calories": "190",
+    "total_fat": "7",
+    "saturated_fat": "1",
+    "trans_fat": "0",
+    "cholesterol": "0",
+    "sodium": "140",
+    "total_carbs": "29",
+    "dietary_fiber": "3",
+    "total_sugars": "12",
+    "added_sugars": "10",
+    "protein": "4",
+    "vitamin_d": "0",
+    "calcium": "20",
+    "iron": "1.1",
+    "potassium": "120"
+})
+
+def renders_per_second(module, format_type, file_format, seconds, cached):
+    """Render the sample label repeatedly for about `seconds` and return the rate"""
+    # Warm fonts and (when cached) the chrome so only steady-state renders are timed
+    module.create_nutrition_label_image(SAMPLE_LABEL, format_type, file_format)
+
+    count = 0
+    start = time.perf_counter()
+    while True:
+        if not cached:
+            module.clear_chrome_cache()
+        module.create_nutrition_label_image(SAMPLE_LABEL, format_type, file_format)
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= seconds:
+            return count / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=1.0, help="time spent on each measurement")
+    parser.add_argument("--file-format", default="png", choices=["png", "jpg"])
+    args = parser.parse_args()
+
+    modules = [
+        ("simple_image_generator", simple_image_generator, ["standard"]),
+        ("image_generator", image_generator, image_generator.LABEL_FORMATS)
+    ]
+
+    print(f"{'module':<24} {'format':<12} {'uncached/s':>11} {'cached/s':>10} {'change':>8}")
+    for name, module, formats in modules:
+        for format_type in formats:
+            uncached = renders_per_second(module, format_type, args.file_format, args.seconds, cached=False)
+            cached = renders_per_second(module, format_type, args.file_format, args.seconds, cached=True)
+            change = (cached / uncached - 1) * 100
+            print(f"{name:<24} {format_type:<12} {uncached:>11.1f} {cached:>10.1f} {change:>+7.1f}%")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Renderer and endpoint benchmarks, recorded to a JSON baseline or compared against one.
+
+Usage:
+    python -m benchmarks.render_suite run [--output FILE] [--seconds 0.5] [--only SUBSTRING]
+    python -m benchmarks.render_suite compare BASELINE [RESULTS] [--threshold 0.25]
+
+run writes to benchmarks/results.json unless given --output; refreshing the
+checked-in baseline takes an explicit --output benchmarks/baseline.json.
+Without RESULTS, compare runs the suite first. It exits with status 1 when a
+case got slower or bigger than the baseline by more than the threshold.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+# Always benchmark against a throwaway SQLite database and live renders, never
+# a configured database, disk cache or rendition store
+BENCHMARK_DB = os.path.join(tempfile.gettempdir(), "nutrition-labeler-benchmark.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{BENCHMARK_DB}"
+os.environ.pop("RENDER_CACHE_DIR", None)
+os.environ["PRERENDER_ON_SAVE"] = "0"
+
+from app.models.label_data import LabelData
+from app.utils import image_generator, pdf_generator, simple_image_generator, svg_generator
+from app.utils.batch_renderer import BatchItem, render_batch, shutdown_render_pool
+from app.utils.font_registry import clear_font_cache
+from app.utils.label_layout import LABEL_FORMATS
+from app.utils.render_cache import render_cache
+
+# Where run writes by default: a scratch file, so a local run never replaces
+# the checked-in baseline that compare checks against
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.json")
+
+# Timed runs of a cold case, each starting from empty caches
+COLD_ITERATIONS = 5
+
+# Labels per batch for the batch render cases
+BATCH_SIZES = (10, 50)
+
+# Metrics compared against the baseline and whether a higher value is better
+METRICS = {
+    "throughput": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_mb": False
+}
+
+# Changes smaller than these are noise however large they are relatively:
+# time per label (latency, or 1/throughput) in milliseconds, and peak RSS in MB
+MIN_TIME_DELTA_MS = 1.0
+MIN_RSS_DELTA_MB = 10.0
+
+SAMPLE_LABEL = {
+    "product_name": "Granola Bar",
+    "serving_size": "40",
+    "servings_per_container": "8",
+    "calories": "190",
+    "total_fat": "7",
+    "saturated_fat": "1",
+    "trans_fat": "0",
+    "cholesterol": "0",
+    "sodium": "140",
+    "total_carbs": "29",
+    "dietary_fiber": "3",
+    "total_sugars": "12",
+    "added_sugars": "10",
+    "protein": "4",
+    "vitamin_d": "0",
+    "calcium": "20",
+    "iron": "1.1",
+    "potassium": "120"
+}
+
+# Numbers the sample labels so no two calls in a run render the same content
+_sample_numbers = itertools.count()
+
+def sample_label():
+    """The sample label with a value that changes on every call, so nothing is served from a cache"""
+    return dict(SAMPLE_LABEL, sodium=str(next(_sample_numbers)))
+
+def sample_label_data():
+    """A sample_label() as the LabelData the renderers take"""
+    return LabelData.from_payload(sample_label())
+
+def clear_caches():
+    """Return the process to a cold start: no fonts, label chrome, scaled layouts, styles or cached renders"""
+    clear_font_cache()
+    image_generator.clear_chrome_cache()
+    svg_generator.compiled_svg.cache_clear()
+    pdf_generator.clear_label_styles()
+    render_cache.clear()
+
+def _reset_peak_rss():
+    # Linux lets a process reset its high-water mark; elsewhere the peak
+    # covers the whole run so far
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+def _peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def measure(run, seconds, setup=None, iterations=None, units=1):
+    """Time run() and return throughput, latency percentiles and peak RSS
+
+    setup, when given, runs untimed before every call. With iterations the
+    case runs that many times from wherever setup leaves it (cold cases);
+    otherwise it is warmed with one untimed call and timed for about
+    `seconds`. units is the number of labels one call renders.
+    """
+    if iterations is None:
+        run()
+
+    _reset_peak_rss()
+    timings = []
+    started = time.perf_counter()
+    while True:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+        if iterations is not None:
+            if len(timings) >= iterations:
+                break
+        elif time.perf_counter() - started >= seconds and len(timings) >= 5:
+            break
+
+    timings.sort()
+    return {
+        "iterations": len(timings),
+        "throughput": round(units * len(timings) / sum(timings), 2),
+        "p50_ms": round(_percentile(timings, 0.50) * 1000, 3),
+        "p99_ms": round(_percentile(timings, 0.99) * 1000, 3),
+        "peak_rss_mb": round(_peak_rss_mb(), 1)
+    }
+
+def renderer_cases():
+    """(name, run) for every renderer, label format and output format"""
+    cases = []
+    for format_type in LABEL_FORMATS:
+        for file_format in ("png", "jpg"):
+            cases.append((
+                f"render/image_generator/{format_type}/{file_format}",
+                lambda f=format_type, o=file_format: image_generator.create_nutrition_label_image(sample_label_data(), f, o)
+            ))
+        cases.append((
+            f"render/pdf_generator/{format_type}/pdf",
+            lambda f=format_type: pdf_generator.create_nutrition_label_pdf(sample_label_data(), f)
+        ))
+        cases.append((
+            f"render/svg_generator/{format_type}/svg",
+            lambda f=format_type: svg_generator.create_nutrition_label_svg(sample_label_data(), f)
+        ))
+    # The simple generator draws every format with the standard layout
+    for file_format in ("png", "jpg"):
+        cases.append((
+            f"render/simple_image_generator/standard/{file_format}",
+            lambda o=file_format: simple_image_generator.create_nutrition_label_image(sample_label_data(), "standard", o)
+        ))
+    return cases
+
+def batch_case(output_format, size):
+    """A run that renders a batch of distinct labels on the process pool"""
+    def run():
+        items = [BatchItem(f"label-{n}.{output_format}", sample_label_data()) for n in range(size)]
+        for _, _, error in render_batch(items, output_format):
+            if error is not None:
+                raise RuntimeError(error)
+    return run
+
+def _check(response):
+    if response.status_code != 200:
+        raise RuntimeError(f"{response.request.path} answered {response.status_code}")
+    return response.get_data()
+
+def endpoint_cases(client, label_id):
+    """(name, run, warm setup) for the preview and PDF download routes"""
+    cases = []
+    for output_format in ("png", "svg", "pdf"):
+        # Every preview payload differs, so warm runs render each time
+        cases.append((
+            f"endpoint/preview/{output_format}",
+            lambda o=output_format: _check(client.post(f"/api/preview?output_format={o}", json=sample_label())),
+            None
+        ))
+    # A stored label is the same every request: warm runs drop its cached
+    # render first, cached runs are served from the render cache
+    download = lambda: _check(client.get(f"/api/labels/{label_id}/pdf"))
+    cases.append(("endpoint/labels_pdf", download, render_cache.clear))
+    cases.append(("endpoint/labels_pdf_cached", download, None))
+    return cases
+
+def run_suite(seconds, only=None):
+    """Run every case (or those whose name contains only) and return the results document"""
+    results = {}
+
+    def record(name, run, **kwargs):
+        if only is not None and only not in name:
+            return
+        result = results[name] = measure(run, seconds, **kwargs)
+        print(
+            f"{name:<52} {result['throughput']:>10.1f}/s  p50 {result['p50_ms']:>9.3f} ms"
+            f"  p99 {result['p99_ms']:>9.3f} ms  {result['peak_rss_mb']:>7.1f} MB",
+            flush=True
+        )
+
+    for name, run in renderer_cases():
+        record(f"{name}/cold", run, setup=clear_caches, iterations=COLD_ITERATIONS)
+        record(f"{name}/warm", run)
+
+    # Batch throughput is labels per second; a cold batch also pays for
+    # starting the worker processes. Peak RSS is this process only.
+    def cold_pool():
+        clear_caches()
+        shutdown_render_pool()
+
+    for output_format in ("png", "jpg", "pdf", "svg"):
+        for size in BATCH_SIZES:
+            run = batch_case(output_format, size)
+            record(f"batch/{output_format}/{size}/cold", run, setup=cold_pool, iterations=COLD_ITERATIONS, units=size)
+            record(f"batch/{output_format}/{size}/warm", run, units=size)
+    shutdown_render_pool()
+
+    # End to end through the Flask app and a fresh SQLite database
+    from app import create_app
+    from app.models.database import create_tables
+
+    if os.path.exists(BENCHMARK_DB):
+        os.remove(BENCHMARK_DB)
+    create_tables()
+    client = create_app().test_client()
+    label_id = client.post("/api/labels", json=dict(SAMPLE_LABEL, format="standard")).get_json()["id"]
+    for name, run, setup in endpoint_cases(client, label_id):
+        if not name.endswith("_cached"):
+            record(f"{name}/cold", run, setup=clear_caches, iterations=COLD_ITERATIONS)
+        record(f"{name}/warm", run, setup=setup)
+
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seconds": seconds
+        },
+        "cases": results
+    }
+
+def _absolute_delta(metric, before, after):
+    # How much worse a metric got in absolute terms (ms per label or MB)
+    if metric == "throughput":
+        return (1000 / after if after else float("inf")) - 1000 / before
+    return after - before
+
+def compare(baseline, current, threshold, min_time_delta=MIN_TIME_DELTA_MS):
+    """Print each case's change against the baseline; returns the regressions as (case, metric, change)"""
+    regressions = []
+    print(f"{'case':<52} " + " ".join(f"{metric:>13}" for metric in METRICS))
+    for name, before in baseline["cases"].items():
+        after = current["cases"].get(name)
+        if after is None:
+            continue
+        changes = []
+        for metric, higher_is_better in METRICS.items():
+            if not before[metric]:
+                changes.append("")
+                continue
+            change = after[metric] / before[metric] - 1
+            # Positive "worse" means slower, less throughput or more memory,
+            # and it only counts once the absolute change is past the noise floor
+            worse = -change if higher_is_better else change
+            floor = MIN_RSS_DELTA_MB if metric == "peak_rss_mb" else min_time_delta
+            regressed = worse > threshold and _absolute_delta(metric, before[metric], after[metric]) > floor
+            if regressed:
+                regressions.append((name, metric, change))
+            changes.append(f"{change:>+11.1%} {'!' if regressed else ' '}")
+        print(f"{name:<52} " + " ".join(f"{change:>13}" for change in changes))
+
+    missing = set(baseline["cases"]) - set(current["cases"])
+    if missing:
+        print(f"\n{len(missing)} baseline case(s) not measured this run")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the suite and write the results")
+    run_parser.add_argument("--output", default=RESULTS_PATH, help=f"results file (default: {os.path.relpath(RESULTS_PATH)})")
+
+    compare_parser = commands.add_parser("compare", help="compare results against a baseline")
+    compare_parser.add_argument("baseline", help="baseline results file")
+    compare_parser.add_argument("results", nargs="?", help="results to compare (default: run the suite now)")
+    compare_parser.add_argument("--threshold", type=float, default=0.25, help="relative change counted as a regression (default: 0.25)")
+    compare_parser.add_argument("--min-delta-ms", type=float, default=MIN_TIME_DELTA_MS, help=f"ignore slowdowns smaller than this per label (default: {MIN_TIME_DELTA_MS})")
+
+    for sub in (run_parser, compare_parser):
+        sub.add_argument("--seconds", type=float, default=0.5, help="time spent on each warm case")
+        sub.add_argument("--only", help="only run cases whose name contains this")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_suite(args.seconds, args.only)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nWrote {len(results['cases'])} cases to {args.output}")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if args.results:
+        with open(args.results) as f:
+            current = json.load(f)
+    else:
+        current = run_suite(args.seconds, args.only)
+        print()
+
+    regressions = compare(baseline, current, args.threshold, args.min_delta_ms)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}:")
+        for name, metric, change in regressions:
+            print(f"  {name} {metric} {change:+.1%}")
+        return 1
+    print(f"\nNo regressions beyond {args.threshold:.0%}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
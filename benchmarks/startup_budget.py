@@ -0,0 +1,115 @@
+"""Startup budget check: times importing the app and calling create_app() in fresh interpreters.
+
+Usage:
+    python -m benchmarks.startup_budget [--budget-ms 900] [--runs 5] [--top 15]
+
+Each run is a new `python -X importtime` process with no DATABASE_URL, so
+startup must not touch the database. The check fails (exit status 1) when
+the fastest run is over budget or when startup imports a module that should
+load on first use (the renderers' Pillow and ReportLab).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Wall time allowed for import plus create_app(), best of the runs (ms)
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 900))
+
+# Top-level packages that must stay out of startup: they are only needed
+# once a label is rendered
+LAZY_PACKAGES = ("PIL", "reportlab")
+
+# Runs in the child: time startup without -X importtime's own overhead
+# skewing it much, then report which lazy packages got loaded
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+create_app()
+elapsed = time.perf_counter() - start
+lazy = %r
+print(json.dumps({
+    "startup_ms": elapsed * 1000,
+    "lazy_loaded": sorted({name.split(".")[0] for name in sys.modules if name.split(".")[0] in lazy})
+}))
+""" % (LAZY_PACKAGES,)
+
+def parse_importtime(stderr):
+    """Return {module: (self us, cumulative us, depth)} from -X importtime output"""
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        # A module imported again at another depth keeps its first (real) timing
+        modules.setdefault(name.strip(), (int(parts[0]), int(parts[1]), depth))
+    return modules
+
+def run_once():
+    """Start the app in a fresh interpreter; returns (probe report, importtime modules)"""
+    env = dict(os.environ)
+    env.pop("DATABASE_URL", None)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"app failed to start:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS, help=f"startup budget (default: {STARTUP_BUDGET_MS:g})")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters started; the fastest counts (default: 5)")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports listed (default: 15)")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    report, modules = min(runs, key=lambda run: run[0]["startup_ms"])
+    timings = sorted(run[0]["startup_ms"] for run in runs)
+
+    print(f"Startup (import + create_app): best {timings[0]:.0f} ms, median {timings[len(timings) // 2]:.0f} ms over {len(runs)} runs")
+    print("\nSlowest imports of the best run (cumulative ms, self ms):")
+    for name, (self_us, cumulative_us, depth) in sorted(modules.items(), key=lambda item: -item[1][1])[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} {self_us / 1000:8.1f}  {'  ' * depth}{name}")
+
+    failures = []
+    if timings[0] > args.budget_ms:
+        failures.append(f"startup took {timings[0]:.0f} ms, over the {args.budget_ms:g} ms budget")
+    for package in report["lazy_loaded"]:
+        # Point at the innermost app module that pulled the package in
+        importers = [name for name in modules if name.startswith("app.") and package in _imported_under(modules, name)]
+        via = max(importers, key=lambda name: modules[name][2]) if importers else None
+        failures.append(f"{package} is imported at startup" + (f" (via {via})" if via else ""))
+
+    if failures:
+        print("\nStartup budget exceeded:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"\nWithin the {args.budget_ms:g} ms budget")
+    return 0
+
+def _imported_under(modules, parent):
+    # -X importtime lists a module's imports just before it, one level deeper
+    names = list(modules)
+    index = names.index(parent)
+    depth = modules[parent][2]
+    children = set()
+    for name in reversed(names[:index]):
+        if modules[name][2] <= depth:
+            break
+        children.add(name.split(".")[0])
+    return children
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+# gunicorn settings, picked up automatically when gunicorn starts in this
+# directory: gunicorn run:app
+import gc
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+
+# Render jobs must live in the database once there is more than one worker
+# (see on_starting); set before the app is loaded so job_queue picks it up
+os.environ.setdefault('JOB_BACKEND', 'database' if workers > 1 else 'memory')
+
+# Load the app in the master so the warm-up below is inherited by every worker
+preload_app = True
+
+def on_starting(server):
+    """Warm the renderers once in the master, before any worker is forked"""
+    from app.utils.job_queue import JOB_BACKEND
+    from app.utils.warmup import warm_up
+
+    # In-memory jobs are only visible to the worker that queued them, so
+    # status polls landing on another worker would get a 404
+    if JOB_BACKEND == "memory" and server.cfg.workers > 1:
+        raise RuntimeError("JOB_BACKEND=memory needs a single worker; set JOB_BACKEND=database or WEB_CONCURRENCY=1")
+
+    warm_up(server.app.wsgi())
+
+    # Move everything loaded so far out of the garbage collector's reach, so
+    # collections in the workers don't write to (and so copy) the shared pages
+    gc.freeze()
@@ -1,6 +1,10 @@
 from app import create_app
+from app.models.database import create_tables
 
 app = create_app()
 
 if __name__ == '__main__':
+    # The dev server sets up its own schema; deployed workers expect
+    # python -m app.models.migrations to have run first
+    create_tables()
     app.run(host='127.0.0.1', port=5000, debug=True)
\ No newline at end of file